@@ -0,0 +1,83 @@
+"""
+Compare vector index backends against exact search.
+
+Reports recall@k of each backend relative to brute-force search and p50/p99
+query latency. Queries are perturbed copies of indexed vectors, so the
+benchmark runs offline:
+
+    python benchmarks/index_bench.py --index data/wise_faq_vdb --k 4
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AGENT_DIR)
+
+from vector_index import AnnoyBackend, ExactIndex, HNSWIndex, load_vectors
+
+
+def _percentile(samples: list[float], q: float) -> float:
+    return float(np.percentile(samples, q)) if samples else 0.0
+
+
+def bench(index, queries: np.ndarray, truth: list[set], k: int) -> dict:
+    latencies = []
+    hits = 0
+    for q, expected in zip(queries, truth):
+        start = time.perf_counter()
+        results = index.query(q, n=k)
+        latencies.append(time.perf_counter() - start)
+        hits += len({r.userdata for r in results} & expected)
+    return {
+        "backend": index.name,
+        "recall_at_k": hits / (k * len(queries)),
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--index", default=os.path.join(AGENT_DIR, "data/wise_faq_vdb"))
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    vectors, ids = load_vectors(args.index)
+    vectors = np.asarray(vectors)
+    rng = np.random.default_rng(0)
+    picks = rng.integers(0, len(ids), size=args.queries)
+    queries = vectors[picks] + rng.normal(0, args.noise, size=(args.queries, vectors.shape[1]))
+    queries = queries.astype(np.float32)
+
+    exact = ExactIndex(vectors, ids, normalized=True)
+    k = min(args.k, len(ids))
+    truth = [{r.userdata for r in exact.query(q, n=k)} for q in queries]
+
+    backends = [exact, AnnoyBackend.load(args.index)]
+    try:
+        backends.append(HNSWIndex.build(vectors, ids))
+    except ImportError:
+        print("hnswlib not installed, skipping HNSW")
+
+    results = [bench(index, queries, truth, k) for index in backends]
+    print(f"{len(ids)} items, {args.queries} queries, k={k}")
+    for r in results:
+        print(
+            f"{r['backend']:>6}  recall@{k}={r['recall_at_k']:.3f}  "
+            f"p50={r['p50_ms']:.3f}ms  p99={r['p99_ms']:.3f}ms"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"items": len(ids), "k": k, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
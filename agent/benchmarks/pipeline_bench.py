@@ -0,0 +1,382 @@
+"""
+Offline latency benchmark of the voice pipeline's RAG turns.
+
+Replays scripted conversations through the same tool-call and retrieval code
+as the agent (`main._answer_with_rag`), with local stand-ins for STT, LLM,
+embeddings and TTS whose latency and jitter are configurable. Runs on CPU
+without any API keys and reports p50/p95/p99 of end-of-speech to first audio
+and of every turn stage:
+
+    python benchmarks/pipeline_bench.py --sessions 4 --output bench.json
+"""
+import argparse
+import asyncio
+import dataclasses
+import hashlib
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any, List, Optional
+
+import numpy as np
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AGENT_DIR)
+# main.py resolves its data files relative to the agent directory
+os.chdir(AGENT_DIR)
+
+from livekit.agents import llm, metrics
+from livekit.agents.log import logger
+
+import main
+from embedders import Embedder
+from session import AgentSession
+from turn_timing import TurnTimings
+from vector_index import load_vectors
+
+
+class Latency:
+    """
+    Normally distributed delay in milliseconds, never negative.
+    """
+
+    def __init__(self, mean_ms: float, jitter_ms: float, rng: random.Random):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self._rng = rng
+
+    def sample(self) -> float:
+        return max(self._rng.gauss(self.mean_ms, self.jitter_ms), 0.0) / 1000
+
+    async def wait(self) -> float:
+        delay = self.sample()
+        await asyncio.sleep(delay)
+        return delay
+
+
+class FakeEmbedder(Embedder):
+    """
+    Embeds a query as a perturbed copy of the indexed vector of its best
+    lexical match, so retrieval finds plausible passages without a model.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: Latency, index_path: str, noise: float = 0.05):
+        vectors, ids = load_vectors(index_path)
+        if not ids:
+            # an empty index would time lookups that never find anything
+            raise SystemExit(f"the vector index at {index_path} is empty, rebuild it")
+        self._vectors = np.asarray(vectors, dtype=np.float32)
+        self._rows = {doc_id: i for i, doc_id in enumerate(ids)}
+        self.dimensions = self._vectors.shape[1]
+        self.latency = latency
+        self.noise = noise
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+        rng = np.random.default_rng(seed)
+        matches = main.get_retriever().lexical_search(text, k=1)
+        if matches and matches[0].userdata in self._rows:
+            base = self._vectors[self._rows[matches[0].userdata]]
+        else:
+            base = rng.normal(size=self.dimensions).astype(np.float32)
+        vec = base + rng.normal(0, self.noise, size=self.dimensions)
+        return (vec / np.linalg.norm(vec)).tolist()
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        await self.latency.wait()
+        return [self._vector(t) for t in texts]
+
+
+class FakeLLMStream:
+    """
+    Streams a reply word by word, shaped like an LLM stream's chunks.
+    """
+
+    def __init__(self, text: str, first_token: Latency, per_token: Latency):
+        self._words = text.split(" ")
+        self._first_token = first_token
+        self._per_token = per_token
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        pass
+
+    async def _chunks(self):
+        await self._first_token.wait()
+        for i, word in enumerate(self._words):
+            if i:
+                await self._per_token.wait()
+            content = word if i == 0 else " " + word
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+    def __aiter__(self):
+        return self._chunks()
+
+
+class FakeLLM:
+    """
+    Answers with the opening sentences of the retrieved context.
+    """
+
+    def __init__(self, first_token: Latency, per_token: Latency, answer_words: int = 60):
+        self.first_token = first_token
+        self.per_token = per_token
+        self.answer_words = answer_words
+
+    def chat(self, chat_ctx: llm.ChatContext, **kwargs) -> FakeLLMStream:
+        context = next(
+            (
+                m.content
+                for m in reversed(chat_ctx.messages)
+                if isinstance(m.content, str) and m.content.startswith("Context:")
+            ),
+            "I'm sorry, I don't have that information. Would you like a human agent?",
+        )
+        words = context.replace("Context:", "", 1).split()[: self.answer_words]
+        return FakeLLMStream(" ".join(words), self.first_token, self.per_token)
+
+
+class FakeTTS:
+    """
+    Time to first audio of a synthesis; phrases already in the phrase cache
+    play immediately, without TTS metrics (None). `cached` is the phrase
+    cache, shared by all sessions like the worker's.
+    """
+
+    def __init__(self, first_byte: Latency, phrases: List[str], cached: set[str]):
+        self.first_byte = first_byte
+        self.phrases = set(phrases)
+        self.answers: set[str] = set()
+        self._cached = cached
+
+    async def first_audio(self, text: Optional[str]) -> Optional[float]:
+        if text is not None and text in self._cached:
+            return None
+        if text is not None and (text in self.phrases or text in self.answers):
+            self._cached.add(text)
+        return await self.first_byte.wait()
+
+
+def tts_metrics(speech_id: str, ttfb: float) -> metrics.PipelineTTSMetrics:
+    """
+    TTS metrics of a speech as the pipeline reports them; fields the
+    benchmark doesn't model are left empty.
+    """
+    fields = {f.name: None for f in dataclasses.fields(metrics.PipelineTTSMetrics)}
+    return metrics.PipelineTTSMetrics(**{**fields, "sequence_id": speech_id, "ttfb": ttfb})
+
+
+class FakeAgent:
+    """
+    The parts of VoicePipelineAgent used by the RAG path: its chat context,
+    LLM and TTS, and `say()`, which plays speeches in order and reports TTS
+    metrics for those that were synthesized, as the pipeline does.
+    """
+
+    _speech_ids = itertools.count()
+
+    def __init__(self, fake_llm: FakeLLM, fake_tts: FakeTTS):
+        self.chat_ctx = main.create_initial_chat_context()
+        self._llm = fake_llm
+        self.tts = fake_tts
+        self.session: Optional[AgentSession] = None
+        # perf_counter() of the first audio of each speech, in playout order
+        self.first_audio: List[float] = []
+        self._playout = asyncio.Lock()
+        self._speeches: List[asyncio.Task] = []
+
+    async def say(self, source, allow_interruptions: bool = True, add_to_chat_ctx: bool = True):
+        done = asyncio.get_running_loop().create_future()
+        handle = SimpleNamespace(id=f"speech_{next(self._speech_ids)}", join=lambda: done)
+        self._speeches.append(
+            asyncio.create_task(self._play(handle.id, source, add_to_chat_ctx, done))
+        )
+        return handle
+
+    async def _play(
+        self, speech_id: str, source, add_to_chat_ctx: bool, done: asyncio.Future
+    ) -> None:
+        try:
+            await self._speak(speech_id, source, add_to_chat_ctx)
+        finally:
+            done.set_result(None)
+
+    async def _speak(self, speech_id: str, source, add_to_chat_ctx: bool) -> None:
+        async with self._playout:
+            text = main._before_tts(self, source)
+            if isinstance(text, str):
+                spoken = [text]
+                ttfb = await self.tts.first_audio(text)
+            else:
+                # synthesis starts as soon as the first chunk is ready (CachedTTS
+                # flushes the TTS stream after every chunk)
+                spoken = []
+                async for chunk in text:
+                    spoken.append(chunk)
+                    break
+                ttfb = await self.tts.first_audio(None)
+            self.first_audio.append(time.perf_counter())
+            if ttfb is not None:
+                # reported through the agent's metrics_collected handler
+                main._record_metrics(self.session, tts_metrics(speech_id, ttfb))
+            if not isinstance(text, str):
+                async for chunk in text:
+                    spoken.append(chunk)
+
+        if add_to_chat_ctx:
+            self.chat_ctx.messages.append(
+                llm.ChatMessage.create(text="".join(spoken), role="assistant")
+            )
+            self.session.history.maintain()
+
+    async def drain(self) -> None:
+        while self._speeches:
+            await self._speeches.pop(0)
+
+
+async def run_conversation(
+    questions: List[str],
+    embedder: Embedder,
+    phrase_cache: set[str],
+    args,
+    rng: random.Random,
+    samples: dict[str, List[float]],
+) -> None:
+    def latency(name: str) -> Latency:
+        return Latency(getattr(args, f"{name}_ms"), getattr(args, f"{name}_jitter_ms"), rng)
+
+    agent = FakeAgent(
+        FakeLLM(latency("llm_first_token"), latency("llm_token")),
+        FakeTTS(latency("tts_first_byte"), main.canned_phrases, phrase_cache),
+    )
+    session = AgentSession(None, agent, embedder)
+    agent.session = session
+
+    for question in questions:
+        end_of_speech = time.perf_counter()
+        # final transcript, then the LLM's decision to call the RAG tool
+        stt = await latency("stt").wait()
+        agent.chat_ctx.messages.append(llm.ChatMessage.create(text=question, role="user"))
+        tool_call = await latency("llm_first_token").wait()
+
+        heard = len(agent.first_audio)
+        turn = TurnTimings(budget=main.rag_latency_budget)
+        await main._answer_with_rag(session, turn)
+        await agent.drain()
+
+        samples.setdefault("stt", []).append(stt)
+        samples.setdefault("tool_call", []).append(tool_call)
+        if len(agent.first_audio) > heard:
+            samples.setdefault("end_of_speech_to_first_audio", []).append(
+                agent.first_audio[heard] - end_of_speech
+            )
+            samples.setdefault("end_of_speech_to_answer_audio", []).append(
+                agent.first_audio[-1] - end_of_speech
+            )
+        if turn.speech_id in session.turns:
+            # every turn must be completed, whether its answer was synthesized
+            # or played from the phrase cache
+            raise RuntimeError(f"turn answered by {turn.speech_id} was never completed")
+        for stage, seconds in turn.stages.items():
+            samples.setdefault(stage, []).append(seconds)
+        samples.setdefault("turn_timed_out", []).append(float(turn.timed_out))
+
+
+def summarize(samples: dict[str, List[float]]) -> dict[str, Any]:
+    summary = {}
+    for name, values in samples.items():
+        if name == "turn_timed_out":
+            summary[name] = {"rate": float(np.mean(values)), "count": len(values)}
+            continue
+        ms = np.asarray(values) * 1000
+        summary[name] = {
+            "count": len(values),
+            "mean_ms": float(ms.mean()),
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)),
+        }
+    return summary
+
+
+async def run(args) -> dict[str, Any]:
+    with open(args.conversations, "r") as f:
+        conversations = json.load(f)
+    if args.no_response_cache:
+        main.response_cache = None
+
+    # shared by all sessions, like the worker's embedder
+    embedder = FakeEmbedder(
+        Latency(args.embedding_ms, args.embedding_jitter_ms, random.Random(args.seed)),
+        main.index_path,
+    )
+    # canned phrases are synthesized at startup
+    phrase_cache = set(main.canned_phrases)
+    samples: dict[str, List[float]] = {}
+    for repeat in range(args.repeats):
+        await asyncio.gather(
+            *(
+                run_conversation(
+                    conversations[(repeat * args.sessions + i) % len(conversations)],
+                    embedder,
+                    phrase_cache,
+                    args,
+                    random.Random(args.seed + repeat * args.sessions + i),
+                    samples,
+                )
+                for i in range(args.sessions)
+            )
+        )
+    return summarize(samples)
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--conversations", default=os.path.join(AGENT_DIR, "benchmarks/conversations.json")
+    )
+    parser.add_argument("--sessions", type=int, default=1, help="concurrent sessions")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-response-cache", action="store_true")
+    for name, mean, jitter in (
+        ("stt", 250, 50),
+        ("embedding", 150, 40),
+        ("llm_first_token", 400, 100),
+        ("llm_token", 15, 5),
+        ("tts_first_byte", 150, 30),
+    ):
+        parser.add_argument(f"--{name.replace('_', '-')}-ms", type=float, default=mean)
+        parser.add_argument(f"--{name.replace('_', '-')}-jitter-ms", type=float, default=jitter)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logger.setLevel(logging.WARNING)
+    results = asyncio.run(run(args))
+
+    for name, stats in results.items():
+        if "rate" in stats:
+            print(f"{name:>32}  rate={stats['rate']:.3f}  n={stats['count']}")
+        else:
+            print(
+                f"{name:>32}  p50={stats['p50_ms']:.1f}ms  p95={stats['p95_ms']:.1f}ms  "
+                f"p99={stats['p99_ms']:.1f}ms  n={stats['count']}"
+            )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
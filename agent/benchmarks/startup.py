@@ -0,0 +1,123 @@
+"""
+Worker process startup benchmark.
+
+Starts fresh interpreters that import the agent module and run `prewarm()`
+the way a job process does, and reports the import time, the prewarm time
+and each prewarm step (VAD, retrieval assets, embedder, phrase cache):
+
+    python benchmarks/startup.py --runs 5 --output startup.json
+
+With `--imports N` it also runs `python -X importtime` on the agent module
+and lists the N slowest modules to import, by their own and cumulative time.
+Phrases are synthesized in the background; set TTS_CACHE_WARM_TIMEOUT to
+include waiting for them in the numbers.
+Worker processes started with PYTHONPROFILEIMPORTTIME=1 write the same
+import profile to their stderr.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, List
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter: one job process's startup, printed as JSON.
+_CHILD = """
+import json, os, time
+from types import SimpleNamespace
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+proc = SimpleNamespace(userdata={})
+main.prewarm(proc)
+print(json.dumps({
+    "import": imported - started,
+    "prewarm": time.perf_counter() - imported,
+    **{f"prewarm.{k}": v for k, v in proc.userdata["startup_timings"].items() if k != "total"},
+}), flush=True)
+# skip interpreter teardown (background threads, plugin shutdown)
+os._exit(0)
+"""
+
+
+def run_once() -> dict[str, float]:
+    result = subprocess.run(
+        [sys.executable, "-c", _CHILD],
+        cwd=AGENT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def import_profile(top: int) -> List[dict[str, Any]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=AGENT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = []
+    # "import time: self [us] | cumulative | imported package"
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        modules.append(
+            {
+                "module": name.strip(),
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            }
+        )
+    return sorted(modules, key=lambda m: m["cumulative_ms"], reverse=True)[:top]
+
+
+def summarize(samples: List[dict[str, float]]) -> dict[str, Any]:
+    summary = {}
+    for name in samples[0]:
+        ms = [s[name] * 1000 for s in samples]
+        summary[name] = {
+            "count": len(ms),
+            "mean_ms": statistics.mean(ms),
+            "min_ms": min(ms),
+            "max_ms": max(ms),
+        }
+    return summary
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to start")
+    parser.add_argument("--imports", type=int, default=0, help="list the N slowest imports")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results: dict[str, Any] = {"startup": summarize([run_once() for _ in range(args.runs)])}
+    for name, stats in results["startup"].items():
+        print(
+            f"{name:>24}  mean={stats['mean_ms']:.1f}ms  min={stats['min_ms']:.1f}ms  "
+            f"max={stats['max_ms']:.1f}ms  n={stats['count']}"
+        )
+
+    if args.imports:
+        results["imports"] = import_profile(args.imports)
+        print()
+        for module in results["imports"]:
+            print(
+                f"{module['cumulative_ms']:>10.1f}ms cumulative  {module['self_ms']:>8.1f}ms self  "
+                f"{module['module']}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
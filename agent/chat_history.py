@@ -0,0 +1,161 @@
+import asyncio
+from typing import List, Optional
+
+from livekit.agents import llm
+from livekit.agents.log import logger
+from livekit.agents.pipeline import VoicePipelineAgent
+
+from chunking import estimate_tokens
+
+CONTEXT_PREFIX = "Context:\n"
+SUMMARY_PREFIX = "Summary of the conversation so far:\n"
+
+SUMMARY_PROMPT = """Summarize this customer support conversation for the agent who continues it.
+Keep the customer's questions, the facts they gave (amounts, currencies, dates, transfer status)
+and what the agent already told them. Write at most five short sentences."""
+
+
+def _message_tokens(msg: llm.ChatMessage) -> int:
+    # a few tokens of per-message overhead, plus tool call arguments
+    tokens = 4
+    if isinstance(msg.content, str):
+        tokens += estimate_tokens(msg.content)
+    for call in msg.tool_calls or []:
+        tokens += estimate_tokens(call.raw_arguments or "")
+    return tokens
+
+
+class ChatHistory:
+    """
+    Keeps the agent's chat context from growing with the length of the call.
+
+    RAG context messages are tracked as they are added; only the newest
+    `keep_contexts` stay in the chat context, older ones were answered
+    already and are dropped. When the context exceeds `token_budget` the
+    oldest turns, all but the last `keep_messages` messages, are summarized
+    by the LLM in the background and replaced by the summary (or dropped if
+    summarization is disabled or fails).
+    """
+
+    def __init__(
+        self,
+        agent: VoicePipelineAgent,
+        token_budget: int = 3000,
+        keep_contexts: int = 1,
+        keep_messages: int = 6,
+        summarize: bool = True,
+    ):
+        self.agent = agent
+        self.token_budget = token_budget
+        self.keep_contexts = keep_contexts
+        self.keep_messages = keep_messages
+        self.summarize = summarize
+        self._contexts: List[llm.ChatMessage] = []
+        self._summary_task: Optional[asyncio.Task] = None
+
+    @property
+    def messages(self) -> List[llm.ChatMessage]:
+        return self.agent.chat_ctx.messages
+
+    def tokens(self) -> int:
+        return sum(_message_tokens(m) for m in self.messages)
+
+    def add_context(self, context: str, before: llm.ChatMessage) -> llm.ChatMessage:
+        """
+        Insert retrieved context just before the question it answers and
+        drop the stale context messages of earlier turns.
+        """
+        rag_msg = llm.ChatMessage.create(text=CONTEXT_PREFIX + context, role="assistant")
+        messages = self.messages
+        if before in messages:
+            messages.insert(messages.index(before), rag_msg)
+        else:
+            messages.extend([rag_msg, before])
+
+        self._contexts.append(rag_msg)
+        cut = max(len(self._contexts) - self.keep_contexts, 0)
+        stale, self._contexts = self._contexts[:cut], self._contexts[cut:]
+        for msg in stale:
+            if msg in messages:
+                messages.remove(msg)
+        return rag_msg
+
+    def maintain(self) -> None:
+        """
+        Called after each committed reply: start compacting the oldest turns
+        if the context is over its token budget.
+        """
+        if self._summary_task is not None and not self._summary_task.done():
+            return
+        tokens = self.tokens()
+        if tokens <= self.token_budget:
+            return
+        old = self._oldest_turns()
+        if not old:
+            return
+        logger.info(
+            f"chat context is {tokens} tokens (budget {self.token_budget}), "
+            f"compacting {len(old)} messages"
+        )
+        self._summary_task = asyncio.create_task(self._compact(old))
+
+    def _oldest_turns(self) -> List[llm.ChatMessage]:
+        messages = self.messages
+        start = 1 if messages and messages[0].role == "system" else 0
+        # cut on a user message so tool calls stay with their results
+        cut = len(messages) - self.keep_messages
+        if cut <= start:
+            # too short to compact; keep everything
+            return []
+        while cut > start and messages[cut].role != "user":
+            cut -= 1
+        return messages[start:cut]
+
+    async def _compact(self, old: List[llm.ChatMessage]) -> None:
+        summary = None
+        if self.summarize:
+            try:
+                summary = await self._summarize(old)
+            except Exception as e:
+                logger.warning(f"failed to summarize the chat context: {e}")
+
+        messages = self.messages
+        positions = [i for i, m in enumerate(messages) if any(m is o for o in old)]
+        if not positions:
+            return
+        insert_at = positions[0]
+        for i in reversed(positions):
+            del messages[i]
+        self._contexts = [m for m in self._contexts if m in messages]
+        if summary:
+            messages.insert(
+                insert_at, llm.ChatMessage.create(text=SUMMARY_PREFIX + summary, role="system")
+            )
+
+    async def _summarize(self, old: List[llm.ChatMessage]) -> str:
+        lines = []
+        for msg in old:
+            if not isinstance(msg.content, str) or not msg.content:
+                continue
+            if msg in self._contexts or msg.role == "tool":
+                continue
+            if msg.content.startswith(SUMMARY_PREFIX):
+                lines.append(msg.content)
+            elif msg.role in ("user", "assistant"):
+                lines.append(f"{msg.role.capitalize()}: {msg.content}")
+        if not lines:
+            return ""
+
+        chat_ctx = llm.ChatContext(
+            messages=[
+                llm.ChatMessage.create(text=SUMMARY_PROMPT, role="system"),
+                llm.ChatMessage.create(text="\n".join(lines), role="user"),
+            ]
+        )
+        parts = []
+        llm_stream = self.agent._llm.chat(chat_ctx=chat_ctx)
+        async with llm_stream:
+            async for chunk in llm_stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+        return "".join(parts).strip()
@@ -0,0 +1,92 @@
+import re
+from typing import List
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token for English text), good
+    enough for budgeting prompt size without loading a tokenizer.
+    """
+    return max(1, (len(text) + 3) // 4)
+
+
+def _is_heading(line: str, next_line: str) -> bool:
+    # scraped articles are flattened to lines; headings are questions or
+    # short unpunctuated lines that introduce a longer paragraph
+    if line.endswith("?"):
+        return True
+    return (
+        len(line.split()) <= 8
+        and line[-1] not in ".,:;!"
+        and len(next_line.split()) > 20
+    )
+
+
+def _sections(content: str) -> List[tuple[str, List[str]]]:
+    lines = []
+    for line in (l.strip() for l in content.split("\n")):
+        # list items are often scraped twice in a row
+        if line and (not lines or lines[-1] != line):
+            lines.append(line)
+
+    sections: List[tuple[str, List[str]]] = [("", [])]
+    for i, line in enumerate(lines):
+        next_line = lines[i + 1] if i + 1 < len(lines) else ""
+        if _is_heading(line, next_line):
+            sections.append((line, []))
+        else:
+            sections[-1][1].append(line)
+    return [(h, p) for h, p in sections if p]
+
+
+def _split_long(paragraph: str, max_tokens: int) -> List[str]:
+    if estimate_tokens(paragraph) <= max_tokens:
+        return [paragraph]
+    parts, current = [], ""
+    for sentence in _SENTENCE_RE.split(paragraph):
+        if current and estimate_tokens(current + " " + sentence) > max_tokens:
+            parts.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        parts.append(current)
+    return parts
+
+
+def chunk_document(doc: dict, max_tokens: int = 200, overlap_tokens: int = 40) -> List[dict]:
+    """
+    Split a scraped article into passages of at most ~`max_tokens`, breaking
+    at headings and paragraph boundaries. Consecutive passages of a section
+    share up to `overlap_tokens` of trailing paragraphs. Each passage is a
+    copy of the document with its own `content`, `heading` and `chunk` index.
+    """
+    chunks: List[dict] = []
+
+    def _emit(heading: str, paragraphs: List[str]) -> None:
+        body = "\n".join(paragraphs)
+        chunk = {k: v for k, v in doc.items() if k != "content"}
+        chunk["content"] = f"{heading}\n{body}" if heading else body
+        chunk["heading"] = heading
+        chunk["chunk"] = len(chunks)
+        chunks.append(chunk)
+
+    for heading, paragraphs in _sections(doc.get("content", "")):
+        current: List[str] = []
+        for paragraph in paragraphs:
+            for part in _split_long(paragraph, max_tokens):
+                if current and estimate_tokens("\n".join(current + [part])) > max_tokens:
+                    _emit(heading, current)
+                    # carry the tail of the previous passage into the next one
+                    tail: List[str] = []
+                    for prev in reversed(current):
+                        if estimate_tokens("\n".join([prev] + tail)) > overlap_tokens:
+                            break
+                        tail.insert(0, prev)
+                    current = tail
+                current.append(part)
+        if current:
+            _emit(heading, current)
+    return chunks
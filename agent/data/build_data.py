@@ -1,103 +1,345 @@
+import argparse
 import asyncio
 import aiohttp
-import pickle
-import uuid
+import hashlib
+import random
 import json
 import os
+import re
+import sys
+import unicodedata
+import numpy as np
 from tqdm import tqdm
 from dotenv import load_dotenv
 
 # Import livekit plugins
-from livekit.plugins import openai, rag
+from livekit.plugins import rag
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AGENT_DIR)
+
+from chunking import chunk_document
+from docstore import DocStore, write_docstore
+from embedders import Embedder, create_embedder, index_paths
+from vector_index import HNSWIndex, HNSW_FILE, EXACT_MAX_ITEMS, save_vectors
+from lexical import BM25Index
 
 # Load environment variables (if you store your API key in .env)
 load_dotenv()
 
-# Set the embedding dimension (for text-embedding-3-small, 1536 is typical)
-embeddings_dimension = 1536
 
-# Asynchronous function to create an embedding for a given input text
-async def _create_embedding(input_text: str, http_session: aiohttp.ClientSession):
-    try:
-        results = await openai.create_embeddings(
-            input=[input_text],
-            model="text-embedding-3-small", 
-            dimensions=embeddings_dimension,
-            http_session=http_session,
+def content_hash(text: str) -> str:
+    """
+    Content address of a document: hash of its NFC-normalized text with
+    whitespace collapsed, so formatting-only changes don't force a re-embed.
+    """
+    normalized = re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+
+def _doc_text(doc: dict) -> str:
+    # Combine title and content; adjust as needed
+    return f"{doc.get('title', '')}\n{doc.get('content', '')}"
+
+
+class VectorStore:
+    """
+    Content-addressed vector cache: an append-only JSON lines file of
+    `{"id": <content hash>, "embedding": [...]}` records, one file per
+    embedder. Vectors are appended as soon as a batch finishes, so an
+    interrupted build resumes where it stopped and a rebuild only embeds
+    new or changed content.
+    """
+
+    def __init__(self, path: str, embedder: Embedder):
+        self.path = path
+        self.header = {"embedder": embedder.name, "dimensions": embedder.dimensions}
+
+    def load(self) -> dict[str, list[float]]:
+        if not os.path.exists(self.path):
+            return {}
+        vectors = {}
+        with open(self.path, 'r') as f:
+            lines = f.read().splitlines()
+        if not lines or json.loads(lines[0]) != self.header:
+            print("Ignoring vector store created with a different embedder")
+            return {}
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # a crash while appending can leave a truncated last line
+                continue
+            vectors[record['id']] = record['embedding']
+        return vectors
+
+    def open(self, resume: bool) -> None:
+        if resume and os.path.exists(self.path):
+            self._f = open(self.path, 'a')
+        else:
+            self._f = open(self.path, 'w')
+            self._f.write(json.dumps(self.header) + "\n")
+
+    def append(self, ids: list[str], vectors: list[list[float]]) -> None:
+        for doc_id, vector in zip(ids, vectors):
+            self._f.write(json.dumps({"id": doc_id, "embedding": vector}) + "\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self) -> None:
+        self._f.close()
+
+    def compact(self, vectors: dict[str, list[float]]) -> None:
+        """
+        Rewrite the store with only the given vectors, dropping content that
+        is no longer indexed.
+        """
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps(self.header) + "\n")
+            for doc_id, vector in vectors.items():
+                f.write(json.dumps({"id": doc_id, "embedding": vector}) + "\n")
+        os.replace(tmp_path, self.path)
+
+
+def _manifest(doc_lookup: dict[str, dict], embedder: Embedder) -> dict:
+    return {
+        "embedder": embedder.name,
+        "dimensions": embedder.dimensions,
+        "documents": {
+            doc_id: {
+                "url": doc.get('url', ''),
+                "title": doc.get('title', ''),
+                "chunk": doc.get('chunk', 0),
+            }
+            for doc_id, doc in doc_lookup.items()
+        },
+    }
+
+
+def manifest_diff(old: dict, new: dict) -> dict:
+    """
+    Compare two manifests. Passages whose URL and position are kept but whose
+    content hash changed are reported as changed rather than as an add + remove.
+    """
+    old_docs = old.get("documents", {})
+    new_docs = new.get("documents", {})
+    added = [i for i in new_docs if i not in old_docs]
+    removed = [i for i in old_docs if i not in new_docs]
+
+    def _key(entry: dict) -> tuple:
+        return (entry["url"], entry.get("chunk", 0))
+
+    old_by_key = {_key(old_docs[i]): i for i in removed if old_docs[i]["url"]}
+    changed = []
+    for doc_id in list(added):
+        old_id = old_by_key.get(_key(new_docs[doc_id]))
+        if old_id is not None:
+            changed.append({"url": new_docs[doc_id]["url"], "old_id": old_id, "new_id": doc_id})
+            added.remove(doc_id)
+            removed.remove(old_id)
+    return {
+        "added": [{"id": i, "url": new_docs[i]["url"]} for i in added],
+        "removed": [{"id": i, "url": old_docs[i]["url"]} for i in removed],
+        "changed": changed,
+        "unchanged": sum(1 for i in new_docs if i in old_docs),
+    }
+
+
+async def _embed_batch(
+    embedder: Embedder,
+    texts: list[str],
+    semaphore: asyncio.Semaphore,
+    max_retries: int,
+) -> list[list[float]]:
+    """
+    Embed one batch, retrying with exponential backoff and jitter.
+    """
+    async with semaphore:
+        for attempt in range(max_retries + 1):
+            try:
+                vectors = await embedder.embed(texts)
+                if len(vectors) != len(texts):
+                    raise ValueError(f"expected {len(texts)} embeddings, got {len(vectors)}")
+                return vectors
+            except Exception as e:
+                if attempt == max_retries:
+                    raise
+                delay = min(2 ** attempt, 30) + random.uniform(0, 1)
+                print(f"Embedding batch failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+
+async def build_index(
+    vector_db_docs: list[dict],
+    embedder: Embedder,
+    batch_size: int = 64,
+    concurrency: int = 4,
+    max_retries: int = 5,
+    store_dir: str = "vector_store",
+    chunk_tokens: int = 200,
+    chunk_overlap: int = 40,
+) -> None:
+    index_path, documents_path = index_paths(embedder.name)
+
+    # Split articles into passages (chunk_tokens=0 indexes whole articles)
+    if chunk_tokens > 0:
+        passages = [
+            chunk
+            for doc in vector_db_docs
+            for chunk in chunk_document(doc, max_tokens=chunk_tokens, overlap_tokens=chunk_overlap)
+        ]
+    else:
+        passages = vector_db_docs
+
+    # Map each passage's content hash to the passage and its text;
+    # identical passages collapse into one entry
+    doc_lookup = {}
+    doc_texts = {}
+    for doc in passages:
+        text = _doc_text(doc)
+        if not text.strip():  # Skip empty documents
+            continue
+        doc_id = content_hash(text)
+        doc_lookup[doc_id] = doc
+        doc_texts[doc_id] = text
+
+    if not doc_lookup:
+        print("No valid documents to process")
+        return
+
+    os.makedirs(store_dir, exist_ok=True)
+    store = VectorStore(os.path.join(store_dir, f"{embedder.name}.jsonl"), embedder)
+    stored = store.load()
+    vectors = {k: v for k, v in stored.items() if k in doc_lookup}
+    print(f"Reusing {len(vectors)}/{len(doc_lookup)} cached embeddings")
+
+    pending = [doc_id for doc_id in doc_lookup if doc_id not in vectors]
+    batches = [pending[i : i + batch_size] for i in range(0, len(pending), batch_size)]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _run_batch(ids: list[str]) -> list[str]:
+        batch_vectors = await _embed_batch(
+            embedder, [doc_texts[i] for i in ids], semaphore, max_retries
         )
-        # Return the embedding vector from the first (and only) result
-        return results[0].embedding
+        # results stay keyed by document id, whatever order batches finish in
+        for doc_id, vector in zip(ids, batch_vectors):
+            vectors[doc_id] = vector
+        store.append(ids, batch_vectors)
+        return ids
+
+    store.open(resume=bool(stored))
+    failed = 0
+    try:
+        tasks = [asyncio.create_task(_run_batch(ids)) for ids in batches]
+        with tqdm(total=len(pending), desc="Creating embeddings") as progress:
+            for task in asyncio.as_completed(tasks):
+                try:
+                    progress.update(len(await task))
+                except Exception as e:
+                    failed += 1
+                    print(f"Error creating embeddings: {e}")
+    finally:
+        store.close()
+
+    if failed:
+        print(f"{failed} batch(es) failed, index not written. Re-run to resume")
+        return
+
+    # Initialize the Annoy index builder from the livekit rag plugin
+    idx_builder = rag.annoy.IndexBuilder(f=embedder.dimensions, metric="angular")
+    for doc_id in doc_lookup:
+        idx_builder.add_item(vectors[doc_id], doc_id)
+
+    try:
+        # Build the Annoy index and save it to disk
+        idx_builder.build()
+        idx_builder.save(os.path.join(AGENT_DIR, index_path))
+
+        # Raw vectors for the exact backend, and an HNSW graph for corpora
+        # too large to search exactly
+        ids = list(doc_lookup)
+        matrix = np.array([vectors[i] for i in ids], dtype=np.float32)
+        save_vectors(os.path.join(AGENT_DIR, index_path), matrix, ids)
+        if len(ids) > EXACT_MAX_ITEMS:
+            try:
+                hnsw = HNSWIndex.build(matrix, ids)
+                hnsw.save(os.path.join(AGENT_DIR, index_path, HNSW_FILE))
+            except ImportError:
+                print("hnswlib not installed, skipping HNSW index")
+
+        # BM25 inverted index over the same passages for hybrid retrieval
+        BM25Index.build((i, doc_texts[i]) for i in ids).save(os.path.join(AGENT_DIR, index_path))
+
+        # Save the documents to the memory-mapped store read by the agent
+        write_docstore(os.path.join(AGENT_DIR, documents_path), doc_lookup)
     except Exception as e:
-        print(f"Error creating embedding: {e}")
-        return None
+        print(f"Error saving data: {e}")
+        return
+
+    # Record what went into this index and how it differs from the last one
+    manifest_path = os.path.join(AGENT_DIR, index_path, "manifest.json")
+    try:
+        with open(manifest_path, 'r') as f:
+            old_manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        old_manifest = {}
+    manifest = _manifest(doc_lookup, embedder)
+    diff = manifest_diff(old_manifest, manifest)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    with open(os.path.join(AGENT_DIR, index_path, "manifest_diff.json"), 'w') as f:
+        json.dump(diff, f, indent=2)
+    print(
+        f"Index built: {len(diff['added'])} added, {len(diff['changed'])} changed, "
+        f"{len(diff['removed'])} removed, {diff['unchanged']} unchanged "
+        f"({len(pending)} embedded)"
+    )
+
+    store.compact(vectors)
+
 
 async def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the FAQ vector index")
+    # a JSON list of documents, or the document store written by scrape.py
+    parser.add_argument("--input", default="wise_faq_vector_db1.json")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--store-dir", default="vector_store")
+    parser.add_argument("--chunk-tokens", type=int, default=200)
+    parser.add_argument("--chunk-overlap", type=int, default=40)
+    args = parser.parse_args()
+
     # Load your documents from the JSON file
     try:
-        with open('wise_faq_vector_db1.json', 'r') as f:
-            vector_db_docs = json.load(f)
+        if args.input.endswith('.json'):
+            with open(args.input, 'r') as f:
+                vector_db_docs = json.load(f)
+        else:
+            store = DocStore.open(args.input)
+            vector_db_docs = [doc for _, doc in store.items()]
+            store.close()
     except FileNotFoundError:
         print("Could not find input JSON file")
         return
     except json.JSONDecodeError:
         print("Error parsing JSON file")
         return
-    
-    # Initialize the Annoy index builder from the livekit rag plugin
-    idx_builder = rag.annoy.IndexBuilder(f=embeddings_dimension, metric="angular")
-    
-    # Dictionary to map a unique document ID (as a string) to its document
-    doc_lookup = {}
-    
-    # Prepare lists to hold tasks and corresponding document IDs
-    tasks = []
-    doc_ids = []
-    
+
     async with aiohttp.ClientSession() as session:
-        # Create asynchronous tasks for each document
-        for doc in vector_db_docs:
-            # Combine title and content; adjust as needed
-            text = f"{doc.get('title', '')}\n{doc.get('content', '')}"
-            if not text.strip():  # Skip empty documents
-                continue
-                
-            # Generate a unique identifier for the document
-            doc_uuid = str(uuid.uuid4())
-            doc_lookup[doc_uuid] = doc
-            doc_ids.append(doc_uuid)
-            # Schedule the asynchronous embedding call
-            tasks.append(asyncio.create_task(_create_embedding(text, session)))
-        
-        if not tasks:
-            print("No valid documents to process")
-            return
-            
-        # Gather embeddings as tasks complete, with a progress bar
-        embeddings_results = []
-        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Creating embeddings"):
-            embedding = await task
-            if embedding:  # Only add valid embeddings
-                embeddings_results.append(embedding)
-        
-        if len(embeddings_results) != len(doc_ids):
-            print("Warning: Some embeddings failed to generate")
-            # Adjust doc_ids to match successful embeddings
-            doc_ids = doc_ids[:len(embeddings_results)]
-            
-        # Add each embedding to the index builder with its corresponding document ID
-        for emb, doc_id in zip(embeddings_results, doc_ids):
-            idx_builder.add_item(emb, doc_id)
-    
-    try:
-        # Build the Annoy index and save it to disk
-        idx_builder.build()
-        idx_builder.save("wise_faq_vdb")
-        
-        # Save the document lookup mapping using pickle for retrieval
-        with open("wise_faq_documents1.pkl", "wb") as f:
-            pickle.dump(doc_lookup, f)
-    except Exception as e:
-        print(f"Error saving data: {e}")
+        # The same embedder (EMBEDDING_BACKEND) is used at query time by the agent
+        embedder = create_embedder(http_session=session)
+        await build_index(
+            vector_db_docs,
+            embedder,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            max_retries=args.max_retries,
+            store_dir=args.store_dir,
+            chunk_tokens=args.chunk_tokens,
+            chunk_overlap=args.chunk_overlap,
+        )
 
 if __name__ == "__main__":
     asyncio.run(main())
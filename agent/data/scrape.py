@@ -1,8 +1,34 @@
-import requests
-from bs4 import BeautifulSoup
+"""
+Crawl Wise help-centre articles into a document store.
+
+Articles are fetched concurrently through one pooled HTTP client, with a
+per-host concurrency and rate limit. Responses are kept in an on-disk cache
+and revalidated with conditional GETs (ETag / Last-Modified), so unchanged
+articles are not downloaded again on a re-crawl. Parsed articles are
+streamed into the document store as they arrive:
+
+    python scrape.py --output wise_faq_articles --max-depth 1
+    python build_data.py --input wise_faq_articles
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
 import time
-import pandas as pd
-# import pdb
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Iterable, Optional
+from urllib.parse import urldefrag, urljoin, urlparse
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AGENT_DIR)
+
+from docstore import DocStoreWriter
 
 # List of URLs to scrape
 urls = [
@@ -19,107 +45,49 @@ headers = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 }
 
-def extract_article_content(url):
-    try:
-        # Add delay to avoid rate limiting
-        time.sleep(1)
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Extract article title
-        title_elem = soup.find('h1')
-        title = title_elem.text.strip() if title_elem else "No title found"
-        
-        # Extract main content (this will need adjustment based on actual page structure)
-        article_content = soup.find('article') or soup.find('div', class_='article-content')
-        
-        if article_content:
-            # Extract all paragraphs
-            for h4 in article_content.find_all('h4'):
-                if 'Related articles' in h4.get_text(strip=True):
-                    # Remove all elements after the "Related articles" section
-                    for sibling in h4.find_all_next():
-                        sibling.decompose()
-                    break  # Stop after the first match
-            paragraphs = article_content.find_all(['p', 'h2', 'h3', 'li'])
-            content = "\n".join([p.text.strip() for p in paragraphs])
-            
-            # Find sublinks within the article
-            sublinks = []
-            for link in article_content.find_all('a', href=True):
-                if '/help/articles/' in link['href']:
-                    sublinks.append({
-                        'text': link.text.strip(),
-                        'url': link['href'] if link['href'].startswith('http') else f"https://wise.com{link['href']}"
-                    })
-            # pdb.set_trace()
-            return {
-                'url': url,
-                'title': title,
-                'content': content,
-                'sublinks': sublinks
-            }
-        else:
-            return {
-                'url': url,
-                'title': title,
-                'content': "Could not extract content",
-                'sublinks': []
-            }
-    except Exception as e:
-        return {
-            'url': url,
-            'title': "Error",
-            'content': f"Error: {str(e)}",
-            'sublinks': []
-        }
-    
-
-def recursive_scrape(start_urls, max_depth=2, visited=None):
-    if visited is None:
-        visited = set()
-    
-    all_data = []
-    queue = [(url, 0) for url in start_urls]  # (url, depth)
-    
-    while queue:
-        current_url, depth = queue.pop(0)
-        
-        if current_url in visited or depth > max_depth:
-            continue
-        
-        visited.add(current_url)
-        print(f"Scraping: {current_url}")
-        
-        article_data = extract_article_content(current_url)
-        all_data.append(article_data)
-        
-        # Add sublinks to queue
-        if depth < max_depth:
-            for sublink in article_data['sublinks']:
-                if sublink['url'] not in visited:
-                    queue.append((sublink['url'], depth + 1))
-    
-    return all_data
-
-# Execute scraping
-faq_data = recursive_scrape(urls, max_depth=1)
-
-# Convert to DataFrame for easier manipulation
-df = pd.DataFrame(faq_data)
-
-# Save to CSV
-df.to_csv('wise_faq_data1.csv', index=False)
-
-# Create JSON format suitable for vector database
-import json
+ARTICLE_PATH = '/help/articles/'
 
-# Format for vector database
-vector_db_docs = []
-for item in faq_data:
-    doc = {
+
+def parse_article(url, html):
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Extract article title
+    title_elem = soup.find('h1')
+    title = title_elem.text.strip() if title_elem else "No title found"
+
+    # Extract main content (this will need adjustment based on actual page structure)
+    article_content = soup.find('article') or soup.find('div', class_='article-content')
+    if not article_content:
+        return None
+
+    for h4 in article_content.find_all('h4'):
+        if 'Related articles' in h4.get_text(strip=True):
+            # Remove all elements after the "Related articles" section
+            for sibling in h4.find_all_next():
+                sibling.decompose()
+            break  # Stop after the first match
+    paragraphs = article_content.find_all(['p', 'h2', 'h3', 'li'])
+    content = "\n".join([p.text.strip() for p in paragraphs])
+
+    # Find sublinks within the article, resolved against the page URL
+    sublinks = []
+    for link in article_content.find_all('a', href=True):
+        if ARTICLE_PATH in link['href']:
+            sublinks.append({
+                'text': link.text.strip(),
+                'url': urldefrag(urljoin(url, link['href']))[0],
+            })
+    return {
+        'url': url,
+        'title': title,
+        'content': content,
+        'sublinks': sublinks
+    }
+
+
+def vector_db_doc(item):
+    # Format for vector database
+    return {
         'url': item['url'],
         'title': item['title'],
         'content': item['content'],
@@ -129,8 +97,198 @@ for item in faq_data:
             'related_links': [sl['url'] for sl in item['sublinks']]
         }
     }
-    vector_db_docs.append(doc)
 
-# Save to JSON
-with open('wise_faq_vector_db1.json', 'w') as f:
-    json.dump(vector_db_docs, f, indent=2)
\ No newline at end of file
+
+class HttpCache:
+    """
+    Responses on disk by URL: the body plus the validators needed to
+    revalidate it with a conditional GET.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def get(self, url: str) -> Optional[tuple[dict, bytes]]:
+        path = self._path(url)
+        try:
+            with open(path + '.json', 'r') as f:
+                meta = json.load(f)
+            with open(path + '.body', 'rb') as f:
+                return meta, f.read()
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, url: str, response_headers, body: bytes) -> None:
+        path = self._path(url)
+        meta = {
+            'url': url,
+            'etag': response_headers.get('ETag'),
+            'last_modified': response_headers.get('Last-Modified'),
+        }
+        for suffix, data, mode in (('.body', body, 'wb'), ('.json', json.dumps(meta), 'w')):
+            tmp_path = f"{path}{suffix}.tmp"
+            with open(tmp_path, mode) as f:
+                f.write(data)
+            os.replace(tmp_path, path + suffix)
+
+
+class HostLimiter:
+    """
+    At most `concurrency` requests in flight and `rate` request starts per
+    second for each host.
+    """
+
+    def __init__(self, concurrency: int = 2, rate: float = 2.0):
+        self.rate = rate
+        self._semaphores = defaultdict(lambda: asyncio.Semaphore(concurrency))
+        self._locks = defaultdict(asyncio.Lock)
+        self._next_start = defaultdict(float)
+
+    @asynccontextmanager
+    async def slot(self, host: str):
+        async with self._semaphores[host]:
+            if self.rate > 0:
+                async with self._locks[host]:
+                    delay = self._next_start[host] - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    self._next_start[host] = time.monotonic() + 1 / self.rate
+            yield
+
+
+class Crawler:
+    """
+    Breadth-first crawl of help-centre articles from a set of start URLs,
+    following article links on the start URLs' hosts up to `max_depth`.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        cache: HttpCache,
+        limiter: HostLimiter,
+        max_depth: int = 1,
+        max_retries: int = 3,
+    ):
+        self.session = session
+        self.cache = cache
+        self.limiter = limiter
+        self.max_depth = max_depth
+        self.max_retries = max_retries
+        self.stats = {'fetched': 0, 'not_modified': 0, 'failed': 0, 'articles': 0}
+
+    async def fetch(self, url: str) -> Optional[bytes]:
+        cached = self.cache.get(url)
+        request_headers = dict(headers)
+        if cached:
+            meta, _ = cached
+            if meta.get('etag'):
+                request_headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                request_headers['If-Modified-Since'] = meta['last_modified']
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.limiter.slot(urlparse(url).netloc):
+                    async with self.session.get(url, headers=request_headers) as response:
+                        if response.status == 304 and cached:
+                            self.stats['not_modified'] += 1
+                            return cached[1]
+                        if response.status == 429 or response.status >= 500:
+                            raise aiohttp.ClientResponseError(
+                                response.request_info, response.history, status=response.status
+                            )
+                        response.raise_for_status()
+                        body = await response.read()
+                        self.cache.put(url, response.headers, body)
+                        self.stats['fetched'] += 1
+                        return body
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = getattr(e, 'status', None)
+                if attempt == self.max_retries or (status is not None and status < 500 and status != 429):
+                    print(f"Failed to fetch {url}: {e}")
+                    self.stats['failed'] += 1
+                    return None
+                await asyncio.sleep(2 ** attempt)
+
+    async def crawl(self, start_urls: Iterable[str], writer: DocStoreWriter, workers: int = 8) -> dict:
+        start_urls = list(start_urls)
+        hosts = {urlparse(url).netloc for url in start_urls}
+        queue: asyncio.Queue = asyncio.Queue()
+        seen = set()
+
+        def enqueue(url, depth):
+            if url not in seen and depth <= self.max_depth and urlparse(url).netloc in hosts:
+                seen.add(url)
+                queue.put_nowait((url, depth))
+
+        async def worker():
+            while True:
+                url, depth = await queue.get()
+                try:
+                    print(f"Scraping: {url}")
+                    body = await self.fetch(url)
+                    if body is None:
+                        continue
+                    article = await asyncio.to_thread(parse_article, url, body)
+                    if article is None:
+                        print(f"Could not extract content from {url}")
+                        continue
+                    # stream the article into the store as soon as it is parsed
+                    writer.add(url, vector_db_doc(article))
+                    self.stats['articles'] += 1
+                    for sublink in article['sublinks']:
+                        enqueue(sublink['url'], depth + 1)
+                except Exception as e:
+                    print(f"Error scraping {url}: {e}")
+                    self.stats['failed'] += 1
+                finally:
+                    queue.task_done()
+
+        for url in start_urls:
+            enqueue(url, 0)
+        tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+        try:
+            await queue.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return self.stats
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Crawl help-centre articles into a document store")
+    parser.add_argument("--output", default="wise_faq_articles")
+    parser.add_argument("--start-url", action="append", help="defaults to the built-in article list")
+    parser.add_argument("--max-depth", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--per-host", type=int, default=2, help="concurrent requests per host")
+    parser.add_argument("--rate", type=float, default=2.0, help="requests per second per host")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--cache-dir", default="http_cache")
+    args = parser.parse_args()
+
+    connector = aiohttp.TCPConnector(limit=args.workers, limit_per_host=args.per_host)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        crawler = Crawler(
+            session,
+            HttpCache(args.cache_dir),
+            HostLimiter(concurrency=args.per_host, rate=args.rate),
+            max_depth=args.max_depth,
+        )
+        with DocStoreWriter(args.output) as writer:
+            stats = await crawler.crawl(args.start_url or urls, writer, workers=args.workers)
+    print(
+        f"{stats['articles']} articles written to {args.output} "
+        f"({stats['fetched']} fetched, {stats['not_modified']} not modified, {stats['failed']} failed)"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
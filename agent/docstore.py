@@ -0,0 +1,155 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+from typing import Any, Iterator, Optional
+
+# File layout (little endian):
+#   header   magic(8) | count u32 | reserved u32 | blob_start u64
+#   entries  count * (id_off u64 | id_len u32 | doc_off u64 | doc_len u32), sorted by id
+#   blob     UTF-8 ids and JSON documents, offsets relative to blob_start
+_MAGIC = b"FAQDOCS1"
+_HEADER = struct.Struct("<8sIIQ")
+_ENTRY = struct.Struct("<QIQI")
+
+
+class DocStore:
+    """
+    Read-only, memory-mapped document store. Opening it only maps the file,
+    so every job process shares the same pages through the page cache;
+    documents are decoded on lookup by binary search over the sorted ids.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, _, self._blob_start = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a document store")
+
+    @classmethod
+    def open(cls, path: str) -> "DocStore":
+        return cls(path)
+
+    def _entry(self, i: int) -> tuple[int, int, int, int]:
+        return _ENTRY.unpack_from(self._mm, _HEADER.size + i * _ENTRY.size)
+
+    def _id_at(self, i: int) -> bytes:
+        id_off, id_len, _, _ = self._entry(i)
+        start = self._blob_start + id_off
+        return self._mm[start : start + id_len]
+
+    def _find(self, doc_id: str) -> int:
+        key = doc_id.encode("utf-8")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._id_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._id_at(lo) == key:
+            return lo
+        return -1
+
+    def get(self, doc_id: str, default: Any = None) -> Optional[dict]:
+        i = self._find(doc_id)
+        if i < 0:
+            return default
+        _, _, doc_off, doc_len = self._entry(i)
+        start = self._blob_start + doc_off
+        return json.loads(self._mm[start : start + doc_len])
+
+    def __getitem__(self, doc_id: str) -> dict:
+        doc = self.get(doc_id)
+        if doc is None:
+            raise KeyError(doc_id)
+        return doc
+
+    def __contains__(self, doc_id: str) -> bool:
+        return self._find(doc_id) >= 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def ids(self) -> Iterator[str]:
+        for i in range(self._count):
+            yield self._id_at(i).decode("utf-8")
+
+    def items(self) -> Iterator[tuple[str, dict]]:
+        for doc_id in self.ids():
+            yield doc_id, self[doc_id]
+
+    def close(self) -> None:
+        self._mm.close()
+
+
+class DocStoreWriter:
+    """
+    Streams documents into a new store. Documents are appended to a
+    temporary blob as they arrive; `close()` writes the sorted offsets table
+    and atomically replaces `path`. Adding an id twice keeps the last copy.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._blob = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path)))
+        self._offset = 0
+        self._entries: dict[bytes, tuple[int, int, int, int]] = {}
+
+    def _append(self, data: bytes) -> int:
+        offset = self._offset
+        self._blob.write(data)
+        self._offset += len(data)
+        return offset
+
+    def add(self, doc_id: str, doc: dict) -> None:
+        key = doc_id.encode("utf-8")
+        data = json.dumps(doc, ensure_ascii=False).encode("utf-8")
+        id_off = self._append(key)
+        doc_off = self._append(data)
+        self._entries[key] = (id_off, len(key), doc_off, len(data))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def close(self) -> None:
+        keys = sorted(self._entries)
+        blob_start = _HEADER.size + len(keys) * _ENTRY.size
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, len(keys), 0, blob_start))
+            for key in keys:
+                f.write(_ENTRY.pack(*self._entries[key]))
+            self._blob.seek(0)
+            while chunk := self._blob.read(1 << 20):
+                f.write(chunk)
+        self._blob.close()
+        os.replace(tmp_path, self.path)
+
+    def __enter__(self) -> "DocStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._blob.close()
+
+
+def write_docstore(path: str, docs: dict[str, dict]) -> None:
+    with DocStoreWriter(path) as writer:
+        for doc_id, doc in docs.items():
+            writer.add(doc_id, doc)
+
+
+if __name__ == "__main__":
+    # Convert a pickled {id: document} lookup from older builds:
+    #   python docstore.py data/wise_faq_documents1.pkl data/wise_faq_docstore
+    import pickle
+    import sys
+
+    with open(sys.argv[1], "rb") as f:
+        write_docstore(sys.argv[2], pickle.load(f))
@@ -0,0 +1,247 @@
+import asyncio
+import os
+from typing import Callable, List, Optional, Union
+
+import aiohttp
+
+from livekit.agents.log import logger
+from livekit.plugins import openai
+
+# Index and document store produced by data/build_data.py for each backend.
+_INDEX_PATHS = {
+    "openai": ("data/wise_faq_vdb", "data/wise_faq_docstore"),
+    "local": ("data/wise_faq_vdb_local", "data/wise_faq_docstore_local"),
+}
+
+
+class Embedder:
+    """
+    Turns a batch of texts into embedding vectors. The same embedder must be
+    used to build the index and to embed queries against it.
+    """
+
+    name: str
+    dimensions: int
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    async def aclose(self) -> None:
+        pass
+
+
+class OpenAIEmbedder(Embedder):
+    """
+    Remote embeddings through the OpenAI API.
+    """
+
+    name = "openai"
+
+    def __init__(
+        self,
+        model: str = "text-embedding-3-small",
+        dimensions: int = 1536,
+        batch_size: int = 256,
+        http_session: Union[aiohttp.ClientSession, Callable[[], aiohttp.ClientSession], None] = None,
+    ):
+        self.model = model
+        self.dimensions = dimensions
+        self.batch_size = batch_size
+        self.http_session = http_session
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[List[float]] = []
+        # a session factory is resolved per call, in the caller's event loop
+        http_session = self.http_session() if callable(self.http_session) else self.http_session
+        for i in range(0, len(texts), self.batch_size):
+            results = await openai.create_embeddings(
+                input=texts[i : i + self.batch_size],
+                model=self.model,
+                dimensions=self.dimensions,
+                http_session=http_session,
+            )
+            # results carry their input index, keep them in input order
+            vectors.extend(r.embedding for r in sorted(results, key=lambda r: r.index))
+        return vectors
+
+
+class LocalEmbedder(Embedder):
+    """
+    CPU-only in-process embeddings with sentence-transformers. The ONNX
+    runtime backend is used when available (optionally with a quantized
+    model file) and falls back to the default torch backend otherwise.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        model: str = "all-MiniLM-L6-v2",
+        batch_size: int = 32,
+        use_onnx: bool = True,
+        onnx_file: Optional[str] = None,
+    ):
+        # optional dependency, only needed for the local backend
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model
+        self.batch_size = batch_size
+        self._model = None
+        if use_onnx:
+            model_kwargs = {"file_name": onnx_file} if onnx_file else None
+            try:
+                self._model = SentenceTransformer(
+                    model, device="cpu", backend="onnx", model_kwargs=model_kwargs
+                )
+            except Exception as e:
+                logger.warning(f"ONNX embedding backend unavailable, using torch: {e}")
+        if self._model is None:
+            self._model = SentenceTransformer(model, device="cpu")
+        self.dimensions = self._model.get_sentence_embedding_dimension()
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        embeddings = self._model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return embeddings.tolist()
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        # keep the event loop free while the model runs
+        return await asyncio.to_thread(self._encode, texts)
+
+
+class BatchingEmbedder(Embedder):
+    """
+    Micro-batches the embedding requests made in a process. Requests only
+    share a batch when they overlap, so each one also waits up to `max_wait`.
+
+    Texts passed to `embed()` are collected for up to `max_wait` seconds, or
+    until `max_batch` texts are pending, and sent to the wrapped embedder as
+    one request; each caller gets its own vectors back. Identical texts in a
+    batch are embedded once.
+    """
+
+    def __init__(self, wrapped: Embedder, max_wait: float = 0.005, max_batch: int = 32):
+        self.wrapped = wrapped
+        self.name = wrapped.name
+        self.dimensions = wrapped.dimensions
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self._pending: List[tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # running batches, referenced until they finish
+        self._tasks: set[asyncio.Task] = set()
+        self.requests = 0
+        self.batches = 0
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._pending.append((text, future))
+            futures.append(future)
+        self.requests += 1
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch, self._pending = self._pending[: self.max_batch], self._pending[self.max_batch :]
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("embedding batch failed", exc_info=task.exception())
+
+    async def _run(self, batch: List[tuple[str, asyncio.Future]]) -> None:
+        # callers that gave up (e.g. a turn over its latency budget) are dropped
+        batch = [(text, future) for text, future in batch if not future.done()]
+        if not batch:
+            return
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        self.batches += 1
+        try:
+            vectors = dict(zip(texts, await self.wrapped.embed(texts)))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future in batch:
+            if not future.done():
+                future.set_result(vectors[text])
+
+    async def aclose(self) -> None:
+        await self.wrapped.aclose()
+
+    def stats(self) -> dict[str, int]:
+        return {"requests": self.requests, "batches": self.batches}
+
+
+def embedding_backend() -> str:
+    return os.getenv("EMBEDDING_BACKEND", "openai")
+
+
+def create_embedder(
+    backend: Optional[str] = None,
+    http_session: Union[aiohttp.ClientSession, Callable[[], aiohttp.ClientSession], None] = None,
+) -> Embedder:
+    """
+    Create the embedder selected by `EMBEDDING_BACKEND` (openai or local).
+    """
+    backend = backend or embedding_backend()
+    if backend == "openai":
+        return OpenAIEmbedder(
+            model=os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small"),
+            dimensions=int(os.getenv("OPENAI_EMBEDDING_DIMENSIONS", "1536")),
+            http_session=http_session,
+        )
+    if backend == "local":
+        return LocalEmbedder(
+            model=os.getenv("LOCAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2"),
+            use_onnx=os.getenv("LOCAL_EMBEDDING_ONNX", "1") == "1",
+            onnx_file=os.getenv("LOCAL_EMBEDDING_ONNX_FILE") or None,
+        )
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def serving_backend() -> str:
+    """
+    The backend the agent answers with: `EMBEDDING_BACKEND`, or openai (with a
+    warning) when that backend's index has not been built.
+    """
+    backend = embedding_backend()
+    index_path, _ = index_paths(backend)
+    if backend != "openai" and not os.path.exists(index_path):
+        logger.warning(
+            f"no {backend} index at {index_path}, using the openai index and embeddings; "
+            f"build it with EMBEDDING_BACKEND={backend} python data/build_data.py"
+        )
+        return "openai"
+    return backend
+
+
+def index_paths(backend: Optional[str] = None) -> tuple[str, str]:
+    """
+    Return the (index, documents) paths for a backend, relative to the agent
+    directory. RAG_INDEX_PATH / RAG_DOCUMENTS_PATH override them.
+    """
+    index_path, documents_path = _INDEX_PATHS[backend or embedding_backend()]
+    return (
+        os.getenv("RAG_INDEX_PATH", index_path),
+        os.getenv("RAG_DOCUMENTS_PATH", documents_path),
+    )
@@ -0,0 +1,109 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+import aiohttp
+from livekit.agents.log import logger
+
+from turn_timing import TurnTimings
+
+# The RAG turn an HTTP request is made for, so connection metrics can be
+# attributed to it. Set at the start of a turn; tasks created from it inherit it.
+current_turn: ContextVar[Optional[TurnTimings]] = ContextVar("current_turn", default=None)
+
+
+class SharedHttpClient:
+    """
+    One pooled aiohttp session per job process, so that every request of a
+    call (query embeddings, across all of its turns) reuses warm keep-alive
+    connections instead of opening new ones.
+
+    livekit runs each job in its own process (a thread on Windows) that runs
+    its own prewarm, so the client is not shared between calls. The session
+    is created lazily on first use, inside the job's event loop, with
+    keep-alive connections, connection limits and default timeouts. The job
+    `acquire()`s the client when it starts and `release()`s it when it ends,
+    which closes the session.
+
+    New connections, their setup time and reused connections are counted per
+    process and recorded on the current RAG turn.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 20,
+        keepalive_timeout: float = 60.0,
+        connect_timeout: float = 3.0,
+        total_timeout: float = 10.0,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._users = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_create_start(session, ctx, params):
+            ctx.connect_started = time.perf_counter()
+
+        async def on_create_end(session, ctx, params):
+            self.connections_created += 1
+            turn = current_turn.get()
+            if turn is not None:
+                turn.record("http_connect", time.perf_counter() - ctx.connect_started)
+                turn.count("http_connections_created")
+
+        async def on_reuse(session, ctx, params):
+            self.connections_reused += 1
+            turn = current_turn.get()
+            if turn is not None:
+                turn.count("http_connections_reused")
+
+        trace.on_connection_create_start.append(on_create_start)
+        trace.on_connection_create_end.append(on_create_end)
+        trace.on_connection_reuseconn.append(on_reuse)
+        return trace
+
+    def session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._loop = loop
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    keepalive_timeout=self.keepalive_timeout,
+                    ttl_dns_cache=300,
+                ),
+                timeout=self.timeout,
+                trace_configs=[self._trace_config()],
+            )
+        return self._session
+
+    def acquire(self) -> None:
+        self._users += 1
+
+    async def release(self) -> None:
+        self._users = max(self._users - 1, 0)
+        if self._users == 0:
+            await self.aclose()
+
+    async def aclose(self) -> None:
+        if self._session is not None and not self._session.closed:
+            logger.debug("closing the shared HTTP client", extra=self.stats())
+            await self._session.close()
+        self._session = None
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+        }
@@ -0,0 +1,126 @@
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Any, Iterable, List
+
+from vector_index import QueryResult
+
+BM25_FILE = "bm25.json"
+
+_TOKEN_RE = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    """a an and are as at be but by can do does for from has have how i if in
+    is it its my of on or our so that the their them there this to was we
+    what when where which who why will with you your""".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased word unigrams without stopwords, plus bigrams of adjacent
+    words so that phrases like "proof of payment" match as a unit.
+    """
+    words = _TOKEN_RE.findall(text.lower())
+    unigrams = [w for w in words if w not in _STOPWORDS]
+    bigrams = [f"{a} {b}" for a, b in zip(words, words[1:])]
+    return unigrams + bigrams
+
+
+class BM25Index:
+    """
+    In-memory inverted index scored with Okapi BM25. `query` returns
+    `QueryResult`s whose `distance` holds the (higher is better) BM25 score.
+    """
+
+    def __init__(
+        self,
+        ids: List[Any],
+        lengths: List[int],
+        postings: dict[str, List[List[int]]],
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.ids = ids
+        self.lengths = lengths
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self._avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+        n = len(ids)
+        self._idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in postings.items()
+        }
+
+    @classmethod
+    def build(cls, documents: Iterable[tuple[Any, str]], **kwargs) -> "BM25Index":
+        ids, lengths = [], []
+        postings: dict[str, List[List[int]]] = defaultdict(list)
+        for i, (doc_id, text) in enumerate(documents):
+            terms = Counter(tokenize(text))
+            ids.append(doc_id)
+            lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                postings[term].append([i, tf])
+        return cls(ids, lengths, dict(postings), **kwargs)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(os.path.join(path, BM25_FILE), "r") as f:
+            data = json.load(f)
+        return cls(data["ids"], data["lengths"], data["postings"], data["k1"], data["b"])
+
+    def save(self, path: str) -> None:
+        with open(os.path.join(path, BM25_FILE), "w") as f:
+            json.dump(
+                {
+                    "ids": self.ids,
+                    "lengths": self.lengths,
+                    "postings": self.postings,
+                    "k1": self.k1,
+                    "b": self.b,
+                },
+                f,
+            )
+
+    def query(self, text: str, n: int) -> List[QueryResult]:
+        scores: dict[int, float] = defaultdict(float)
+        for term in set(tokenize(text)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / self._avg_length)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n]
+        return [QueryResult(self.ids[i], score) for i, score in top]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def reciprocal_rank_fusion(rankings: List[List[Any]], k: int = 60) -> List[tuple[Any, float]]:
+    """
+    Fuse several ranked id lists: each id scores sum(1 / (k + rank)) over the
+    lists it appears in. Returns `(id, score)` sorted best first.
+    """
+    scores: dict[Any, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def load_bm25_index(path: str, documents) -> BM25Index:
+    """
+    Load the BM25 index saved next to the vector index, or build it from the
+    document store for indexes that predate it.
+    """
+    if os.path.exists(os.path.join(path, BM25_FILE)):
+        return BM25Index.load(path)
+    return BM25Index.build(
+        (doc_id, f"{doc.get('title', '')}\n{doc.get('content', '')}")
+        for doc_id, doc in documents.items()
+    )
@@ -1,10 +1,12 @@
 import asyncio
-import json
 import os
-import requests
+import random
+import threading
+import time
+from contextlib import contextmanager
 
 from livekit import rtc
-from livekit.agents import JobContext, WorkerOptions, cli, JobProcess, llm
+from livekit.agents import JobContext, WorkerOptions, cli, JobProcess, llm, metrics
 from livekit.agents.llm import (
     ChatContext,
     ChatMessage,
@@ -13,103 +15,491 @@ from typing import Annotated
 
 from livekit.agents.pipeline import VoicePipelineAgent
 from livekit.agents.log import logger
-from livekit.plugins import deepgram, silero, cartesia, openai, rag
-from typing import List, Any
+from livekit.plugins import deepgram, silero, cartesia, openai
+from typing import List, Optional
 
 from dotenv import load_dotenv
-from openai_agent import create_voice_agent
-
-import numpy as np
-import pickle
-import pdb
+from turn_timing import TurnTimings, timed_llm_text
+from http_client import SharedHttpClient, current_turn
+from rag_cache import SemanticCache, TTLCache
+from embedders import BatchingEmbedder, Embedder, create_embedder, index_paths, serving_backend
+from retrieval import Passage, Retriever, assemble_context
+from docstore import DocStore
+from vector_index import load_vector_index
+from lexical import load_bm25_index
+from speculative import SpeculativeRetrieval
+from phrase_cache import CachedTTS, PhraseCache, warm_phrase_cache
+from session import AgentSession
+from chat_history import SUMMARY_PREFIX, ChatHistory
+from response_cache import FileBackend, MemoryBackend, ResponseCache, text_hash
+from voices import VoiceCatalogue, VoiceRegistry
+from speech_chunks import ChunkPolicy, speakable_chunks, strip_markdown
+import pipeline_metrics
 
 load_dotenv()
 
-annoy_index = rag.annoy.AnnoyIndex.load('data/wise_faq_vdb')
-embeddings_dimension = 1536
+# EMBEDDING_BACKEND, unless its index is missing
+embedding_backend = serving_backend()
+index_path, documents_path = index_paths(embedding_backend)
+
+# Per-turn deadline (seconds) for embedding + index lookup. When it is missed the
+# turn is answered without retrieved context, or with RAG_FALLBACK_PHRASE if set.
+rag_latency_budget = float(os.getenv("RAG_LATENCY_BUDGET", "1.5"))
+rag_fallback_phrase = os.getenv("RAG_FALLBACK_PHRASE", "")
+
+# Number of passages retrieved per question, and the token budget they fill
+rag_top_k = int(os.getenv("RAG_TOP_K", "4"))
+rag_context_tokens = int(os.getenv("RAG_CONTEXT_TOKENS", "600"))
+rag_max_passages_per_source = int(os.getenv("RAG_MAX_PASSAGES_PER_SOURCE", "1"))
+
+# Passages further than this angular distance (0 = identical, 2 = opposite) from
+# the question are ignored. When none are close enough the turn skips the LLM
+# and answers with RAG_NO_MATCH_PHRASE.
+rag_max_distance = float(os.getenv("RAG_MAX_DISTANCE", "1.2"))
+# Passages matched only lexically count as relevant from this BM25 score
+rag_min_lexical_score = float(os.getenv("RAG_MIN_LEXICAL_SCORE", "8.0"))
+rag_no_match_phrase = os.getenv(
+    "RAG_NO_MATCH_PHRASE",
+    "I'm sorry, I couldn't find an answer to that in our help centre. "
+    "Would you like me to connect you with a human agent?",
+)
 
-with open('./data/wise_faq_documents1.pkl', 'rb') as f:
-    faq_data = pickle.load(f)
+# Query embeddings requested within this window are sent as one request, up to
+# EMBEDDING_BATCH_MAX queries. The embedder is per job process, so with
+# livekit's default executor (one process per job) only one session's queries
+# (e.g. overlapping speculative lookups) share a batch, and every uncached query
+# waits out the window. Off (0) by default.
+embedding_batch_window = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "0")) / 1000
+embedding_batch_max = int(os.getenv("EMBEDDING_BATCH_MAX", "32"))
+
+# Start retrieval on interim STT transcripts while the user is still talking
+rag_speculative = os.getenv("RAG_SPECULATIVE", "1") == "1"
+
+# Only the newest retrieved context stays in the chat context. Past this many
+# tokens the oldest turns are summarized (CHAT_CONTEXT_SUMMARIZE=1) or dropped,
+# keeping the last CHAT_CONTEXT_KEEP_MESSAGES messages verbatim.
+chat_context_token_budget = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "3000"))
+chat_context_keep_messages = int(os.getenv("CHAT_CONTEXT_KEEP_MESSAGES", "6"))
+chat_context_summarize = os.getenv("CHAT_CONTEXT_SUMMARIZE", "1") == "1"
+
+SYSTEM_PROMPT = """You are a helpful Wise customer support agent. Answer questions using only the context provided. 
+                If the needed information isn't there, kindly let the customer know and offer to connect them with a human agent. 
+                Keep your tone friendly, professional, conversational, and concise.
+                When replying from the context, reply in conversational manner, not bullet points. Keep it short and concise."""
+
+# Answers are cached per (top retrieved document, normalized question, system
+# prompt) in memory or, with RESPONSE_CACHE_BACKEND=file, on disk for all
+# worker processes. "off" disables the cache. Only answers to the caller's first
+# question are stored, as they can't depend on earlier turns of the call; any
+# matching question is served from it. With RESPONSE_CACHE_AUDIO=1 the
+# synthesized audio of a cached answer is kept in the phrase cache as well, for
+# RESPONSE_CACHE_TTL seconds and within RESPONSE_CACHE_AUDIO_MB (in memory and
+# on disk), least recently used first.
+response_cache_backend = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+response_cache_ttl = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+response_cache_audio = os.getenv("RESPONSE_CACHE_AUDIO", "1") == "1"
+response_cache_audio_mb = int(os.getenv("RESPONSE_CACHE_AUDIO_MB", "64"))
+
+# LLM output is regrouped into sentence or clause chunks before TTS: the first
+# chunk as soon as it reaches TTS_FIRST_CHUNK_CHARS, later ones as sentences of
+# at least TTS_MIN_CHUNK_CHARS, none much longer than TTS_MAX_CHUNK_CHARS.
+tts_chunk_policy = ChunkPolicy(
+    first_min_chars=int(os.getenv("TTS_FIRST_CHUNK_CHARS", "20")),
+    min_chars=int(os.getenv("TTS_MIN_CHUNK_CHARS", "60")),
+    max_chars=int(os.getenv("TTS_MAX_CHUNK_CHARS", "250")),
+)
 
+DEFAULT_VOICE = "248be419-c632-4f23-adf1-5324ed7dbf1d"
+DEFAULT_TTS_MODEL = "sonic"
+
+GREETING = "Hi there, I am Claire from Wise. How can I help you today?"
+TRANSFER_PHRASE = "I'm transferring you to a human agent. Please hold on."
+VOICE_CHANGE_PHRASE = "How do I sound now?"
+
+# Played while retrieval runs, separated by "|" in RAG_FILLER_PHRASES
+rag_filler_phrases = [
+    p.strip()
+    for p in os.getenv(
+        "RAG_FILLER_PHRASES",
+        "Let me look that up for you.|One moment while I check that.|"
+        "Let me check our help centre.|Sure, let me find that for you.",
+    ).split("|")
+    if p.strip()
+]
+
+# Fixed phrases are synthesized once and replayed from the phrase cache
+canned_phrases = [
+    p
+    for p in (
+        GREETING,
+        TRANSFER_PHRASE,
+        VOICE_CHANGE_PHRASE,
+        rag_no_match_phrase,
+        rag_fallback_phrase,
+        *rag_filler_phrases,
+    )
+    if p
+]
+tts_cache_dir = os.getenv("TTS_CACHE_DIR", "data/tts_cache")
+# seconds prewarm waits for phrase synthesis; 0 leaves it all to the background
+tts_cache_warm_timeout = float(os.getenv("TTS_CACHE_WARM_TIMEOUT", "0"))
+
+# The Cartesia voice list is read from a cache shared by all worker processes
+# (or the bundled snapshot) and refreshed in the background once it is older
+# than CARTESIA_VOICES_TTL seconds.
+cartesia_voices_cache = os.getenv("CARTESIA_VOICES_CACHE", "data/cartesia_voices_cache.json")
+cartesia_voices_snapshot = "data/cartesia_voices.json"
+cartesia_voices_ttl = float(os.getenv("CARTESIA_VOICES_TTL", "86400"))
+# Pre-synthesize the canned phrases in the background when the voice changes
+tts_cache_warm_on_voice_change = os.getenv("TTS_CACHE_WARM_ON_VOICE_CHANGE", "1") == "1"
+
+# Prometheus metrics of all jobs are served on METRICS_HOST:METRICS_PORT/metrics
+# by the worker's main process (0 disables); each job process writes its own to
+# METRICS_DIR, a directory used for nothing else. Per-turn trace spans are
+# appended to METRICS_TRACE_FILE as JSON lines when it is set.
+metrics_host = os.getenv("METRICS_HOST", "127.0.0.1")
+metrics_port = int(os.getenv("METRICS_PORT", "9464"))
+metrics_dir = os.getenv("METRICS_DIR", "data/metrics")
+metrics_trace_file = os.getenv("METRICS_TRACE_FILE", "")
+
+_retriever: Optional[Retriever] = None
+_retriever_lock = threading.Lock()
+
+def get_retriever() -> Retriever:
+    """
+    The process's retriever, loaded on first use (normally in `prewarm`) so
+    importing this module stays cheap and the dispatcher process, which
+    never answers questions, never loads it.
+    """
+    global _retriever
+    with _retriever_lock:
+        if _retriever is None:
+            # exact, annoy or hnsw, chosen by corpus size unless VECTOR_INDEX_BACKEND
+            # is set; vectors and documents are memory-mapped, so job processes
+            # share them through the page cache
+            vector_index = load_vector_index(index_path)
+            faq_data = DocStore.open(documents_path)
+            # Query embeddings are cached by normalized text, and results are reused
+            # for embeddings within RAG_SEMANTIC_CACHE_DISTANCE of an earlier query.
+            _retriever = Retriever(
+                vector_index,
+                faq_data,
+                embedding_cache=TTLCache(
+                    maxsize=int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "512")),
+                    ttl=float(os.getenv("RAG_EMBEDDING_CACHE_TTL", "3600")),
+                ),
+                results_cache=SemanticCache(
+                    max_distance=float(os.getenv("RAG_SEMANTIC_CACHE_DISTANCE", "0.08")),
+                    maxsize=int(os.getenv("RAG_SEMANTIC_CACHE_SIZE", "256")),
+                    ttl=float(os.getenv("RAG_SEMANTIC_CACHE_TTL", "3600")),
+                ),
+                # BM25 over the same passages, fused with the vector ranking
+                lexical=load_bm25_index(index_path, faq_data),
+            )
+        return _retriever
 
+def _create_response_cache() -> Optional[ResponseCache]:
+    if response_cache_backend == "memory":
+        backend = MemoryBackend(
+            maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")), ttl=response_cache_ttl
+        )
+    elif response_cache_backend == "file":
+        backend = FileBackend(
+            os.getenv("RESPONSE_CACHE_DIR", "data/response_cache"), ttl=response_cache_ttl
+        )
+    else:
+        return None
+    return ResponseCache(backend, prompt_version=text_hash(SYSTEM_PROMPT)[:12])
 
-# Extract embeddings and build lookup
-# embeddings = np.array([doc['embedding'] for doc in faq_data]).astype('float32')
-# doc_lookup = {i: doc for i, doc in enumerate(faq_data)}
+response_cache = _create_response_cache()
 
-_chat_ctx_lock = asyncio.Lock()
+@contextmanager
+def _startup_step(timings: dict[str, float], name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
 
 def prewarm(proc: JobProcess):
+    started = time.perf_counter()
+    timings = proc.userdata["startup_timings"] = {}
     # preload models when process starts to speed up first interaction
-    proc.userdata["vad"] = silero.VAD.load()
-
-    # fetch cartesia voices
-
-    headers = {
-        "X-API-Key": os.getenv("CARTESIA_API_KEY", ""),
-        "Cartesia-Version": "2024-08-01",
-        "Content-Type": "application/json",
-    }
-    response = requests.get("https://api.cartesia.ai/voices", headers=headers)
-    if response.status_code == 200:
-        proc.userdata["cartesia_voices"] = response.json()
-    else:
-        logger.warning(f"Failed to fetch Cartesia voices: {response.status_code}")
+    with _startup_step(timings, "vad"):
+        proc.userdata["vad"] = silero.VAD.load()
+    with _startup_step(timings, "retrieval"):
+        retriever = get_retriever()
+    # one keep-alive connection pool for the job run by this process, opened on first use
+    http_client = SharedHttpClient(
+        limit=int(os.getenv("HTTP_POOL_LIMIT", "100")),
+        limit_per_host=int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20")),
+        keepalive_timeout=float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60")),
+        connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "3")),
+        total_timeout=float(os.getenv("HTTP_REQUEST_TIMEOUT", "10")),
+    )
+    proc.userdata["http_client"] = http_client
+    # the query embedder (EMBEDDING_BACKEND) is loaded once per process
+    with _startup_step(timings, "embedder"):
+        embedder = create_embedder(embedding_backend, http_session=http_client.session)
+    if embedding_batch_window > 0:
+        # concurrent queries of this process are sent together
+        embedder = BatchingEmbedder(
+            embedder, max_wait=embedding_batch_window, max_batch=embedding_batch_max
+        )
+    proc.userdata["embedder"] = embedder
+    # pre-synthesized audio for canned phrases in the default voice
+    phrase_cache = PhraseCache(
+        tts_cache_dir,
+        answer_max_bytes=response_cache_audio_mb * 1024 * 1024,
+        answer_ttl=response_cache_ttl,
+    )
+    with _startup_step(timings, "phrase_cache"):
+        warm_phrase_cache(
+            phrase_cache,
+            canned_phrases,
+            timeout=tts_cache_warm_timeout,
+            voice=DEFAULT_VOICE,
+            model=DEFAULT_TTS_MODEL,
+        )
+    proc.userdata["phrase_cache"] = phrase_cache
+
+    pipeline_metrics.register_cache_stats(
+        {
+            "query_embedding": retriever.embedding_cache.stats,
+            "retrieval": retriever.results_cache.stats,
+            "phrase": phrase_cache.stats,
+        }
+    )
+    if metrics_port:
+        proc.userdata["metrics_exporter"] = pipeline_metrics.export_metrics(metrics_dir)
+    if metrics_trace_file:
+        pipeline_metrics.enable_tracing(metrics_trace_file)
+
+    # cartesia voices, without waiting on the Cartesia API
+    proc.userdata["voice_catalogue"] = VoiceCatalogue(
+        cartesia_voices_cache,
+        cartesia_voices_snapshot,
+        ttl=cartesia_voices_ttl,
+    ).load()
+
+    timings["total"] = time.perf_counter() - started
+    logger.info(
+        "process ready in "
+        + " ".join(f"{k}={v * 1000:.0f}ms" for k, v in timings.items()),
+        extra={"startup_timings": dict(timings)},
+    )
 
-async def _enrich_with_rag(agent: VoicePipelineAgent, chat_ctx: llm.ChatContext) -> None:
+def _build_context(passages: List[Passage], query: str) -> tuple[str, Optional[Passage]]:
     """
-    Locate the last user message, use it to query the RAG model for
-    the most relevant paragraph, add that to context, and generate a response.
+    Drop passages that are neither close to the question nor a strong lexical
+    match, and assemble the rest into a context block that fits the token
+    budget. Returns the context, empty when nothing is relevant, and the
+    best passage.
     """
-    async with _chat_ctx_lock:
-        user_msg = chat_ctx.messages[-1]
-    # Let's sleep for 5 seconds to simulate a delay
-    await asyncio.sleep(2)
-    # user_embedding = model.encode(user_msg.content)
-    user_embedding = await openai.create_embeddings(
-        input = [user_msg.content],
-        model = "text-embedding-3-small",
-        dimensions = embeddings_dimension,
+    logger.info(
+        "retrieved "
+        + (
+            ", ".join(
+                f"{p.url or p.id} (distance={p.distance:.3f}, bm25={p.lexical_score:.2f})"
+                for p in passages
+            )
+            or "nothing"
+        ),
+        extra={
+            "distances": [p.distance for p in passages],
+            "lexical_scores": [p.lexical_score for p in passages],
+            "max_distance": rag_max_distance,
+        },
     )
-    result = annoy_index.query(user_embedding[0].embedding, n=1)[0]
-    # print(result)
-    result_doc = faq_data[result.userdata]
-    # relevant_docs = get_relevant_docs(user_embedding, k=3, distance_threshold=0.0)
-    # relevant_docs = annoy_index.get_nns_by_vector(user_embedding, 3, include_distances=True)
-    if result_doc:
-        logger.info(f"Found {result_doc.get('url', 'No URL found')}")
-        rag_msg = llm.ChatMessage.create(
-            text = "Context:\n" + result_doc.get('content', ''),
-            role = "assistant",
+    for p in passages:
+        if p.distance != float("inf"):
+            pipeline_metrics.retrieved_distance.observe(p.distance)
+    passages = [
+        p
+        for p in passages
+        if p.distance <= rag_max_distance or p.lexical_score >= rag_min_lexical_score
+    ]
+    context = assemble_context(
+        passages,
+        token_budget=rag_context_tokens,
+        max_per_source=rag_max_passages_per_source,
+        query=query,
+    )
+    return context, passages[0] if passages else None
+
+async def _retrieve(
+    query: str,
+    embedder: Embedder,
+    turn: TurnTimings,
+    lexical_results: list,
+    speculative: Optional[SpeculativeRetrieval] = None,
+) -> tuple[str, Optional[Passage]]:
+    passages = None
+    if speculative is not None:
+        # results of lookups started on the user's interim transcripts
+        started = turn.elapsed()
+        passages = await speculative.take(query)
+        pipeline_metrics.cache_requests.inc(
+            cache="speculative", result="miss" if passages is None else "hit"
+        )
+        if passages is not None:
+            turn.record("speculative_wait", turn.elapsed() - started)
+    if passages is None:
+        passages = await get_retriever().search(
+            query, embedder, turn, k=rag_top_k, lexical_results=lexical_results
         )
-        async with _chat_ctx_lock:
-            # Replace last message with RAG, then append user message at the end
-            chat_ctx.messages[-1] = rag_msg
-            chat_ctx.messages.append(user_msg)
+    logger.debug("RAG cache stats", extra=get_retriever().cache_stats())
+    return _build_context(passages, query)
+
+def _is_first_question(chat_ctx: ChatContext, user_msg: ChatMessage) -> bool:
+    """
+    True when nothing the caller said before `user_msg` (earlier turns or
+    their summary) is in the chat context.
+    """
+    for msg in chat_ctx.messages:
+        if msg is user_msg:
+            return True
+        if msg.role == "user":
+            return False
+        if isinstance(msg.content, str) and msg.content.startswith(SUMMARY_PREFIX):
+            return False
+    return True
+
+async def _enrich_with_rag(session: AgentSession, turn: TurnTimings) -> None:
+    """
+    Locate the last user message, use it to query the RAG model for
+    the most relevant paragraph, add that to context, and generate a response.
+
+    Retrieval is bounded by the turn's latency budget; if it misses the
+    deadline the turn falls back to the lexical candidates, and failing
+    those to a non-RAG answer, instead of hanging. If nothing relevant is
+    found the LLM is skipped and the caller is offered a human agent.
 
-            # Generate a response using the enriched context
+    Retrieval runs concurrently with the session's other tool calls; the
+    chat-context edit and the answer are applied in tool-call order.
+    """
+    agent = session.agent
+    chat_ctx = agent.chat_ctx
+    user_msg = chat_ctx.messages[-1]
+    # HTTP connection metrics of this task (and its subtasks) go to the turn
+    current_turn.set(turn)
+    ticket = session.chat_ctx_sequencer.ticket()
+    try:
+        # the lexical candidates are ready before the embedding request returns
+        with turn.stage("lexical"):
+            lexical_results = get_retriever().lexical_search(user_msg.content, k=rag_top_k)
+
+        context, top = "", None
+        try:
+            context, top = await asyncio.wait_for(
+                _retrieve(
+                    user_msg.content, session.embedder, turn, lexical_results, session.speculative
+                ),
+                timeout=turn.remaining(),
+            )
+        except asyncio.TimeoutError:
+            turn.timed_out = True
+            context, top = _build_context(
+                get_retriever().lexical_passages(lexical_results), user_msg.content
+            )
+            logger.warning(
+                f"RAG retrieval exceeded its {turn.budget:.2f}s budget, answering with "
+                + ("lexical matches only" if context else "no context")
+            )
+
+        async with session.chat_ctx_sequencer.turn(ticket):
+            if turn.timed_out and not context and rag_fallback_phrase:
+                await session.say_for_turn(turn, rag_fallback_phrase, allow_interruptions=True)
+                return
+
+            if not turn.timed_out and not context:
+                logger.info("no passage within the relevance threshold, skipping the LLM")
+                await session.say_for_turn(turn, rag_no_match_phrase, allow_interruptions=True)
+                return
+
+            if context:
+                # Insert the RAG context just before the question it answers,
+                # replacing the context of earlier, answered turns
+                session.history.add_context(context, before=user_msg)
+
+            answer = None
+            if response_cache and top:
+                with turn.stage("response_cache"):
+                    answer = response_cache.get(top.id, user_msg.content, text_hash(top.text))
+                pipeline_metrics.cache_requests.inc(
+                    cache="response", result="hit" if answer else "miss"
+                )
+            if answer:
+                logger.info("answering from the response cache", extra=response_cache.stats())
+                if response_cache_audio:
+                    # recorded the first time it is spoken, replayed after that
+                    agent.tts.answers.add(strip_markdown(answer))
+                await session.say_for_turn(turn, answer, allow_interruptions=True)
+                return
+
+            # Generate a response using the (possibly) enriched context
             llm_stream = agent._llm.chat(chat_ctx=chat_ctx)
-            await agent.say(llm_stream)
+            text = timed_llm_text(llm_stream, turn)
+            # answers to follow-up questions depend on the earlier turns and
+            # may carry the caller's details, they are not shared
+            if response_cache and top and _is_first_question(chat_ctx, user_msg):
+                text = response_cache.record(
+                    text, top.id, user_msg.content, text_hash(top.text)
+                )
+            await session.say_for_turn(turn, text)
+    finally:
+        await session.chat_ctx_sequencer.done(ticket)
+
+async def _answer_with_rag(session: AgentSession, turn: TurnTimings) -> None:
+    """
+    Body of the `enrich_with_rag` tool call.
+    """
+    # a pre-synthesized filler plays right away; retrieval runs while it
+    # is spoken and the answer is queued behind it
+    if rag_filler_phrases:
+        await session.agent.say(random.choice(rag_filler_phrases), add_to_chat_ctx=False)
+    await _enrich_with_rag(session, turn)
+
+def _before_tts(agent: VoicePipelineAgent, text):
+    # markdown is never spoken; streamed replies are cut into speakable chunks
+    if isinstance(text, str):
+        return strip_markdown(text)
+    return speakable_chunks(text, tts_chunk_policy)
+
+def _record_metrics(session: AgentSession, mtrcs: metrics.AgentMetrics) -> None:
+    if isinstance(mtrcs, metrics.PipelineLLMMetrics):
+        pipeline_metrics.llm_ttft.observe(mtrcs.ttft)
+    # the first synthesis of a RAG answer completes that turn's timings
+    if isinstance(mtrcs, metrics.PipelineTTSMetrics):
+        pipeline_metrics.tts_ttfb.observe(mtrcs.ttfb)
+        session.complete_turn(mtrcs.sequence_id, mtrcs.ttfb)
 
 def create_initial_chat_context() -> ChatContext:
     return ChatContext(
         messages=[
             ChatMessage(
                 role="system",
-                content="""You are a helpful Wise customer support agent. Answer questions using only the context provided. 
-                If the needed information isn't there, kindly let the customer know and offer to connect them with a human agent. 
-                Keep your tone friendly, professional, conversational, and concise.
-                When replying from the context, reply in conversational manner, not bullet points. Keep it short and concise.""",
+                content=SYSTEM_PROMPT,
             )
         ]
     )
 
 async def entrypoint(ctx: JobContext):
-    cartesia_voices: List[dict[str, Any]] = ctx.proc.userdata["cartesia_voices"]
+    # label the trace spans of this job
+    pipeline_metrics.session_labels.set({"room": ctx.job.room.name, "session": ctx.job.id})
+    # the latest list, including a refresh written by any process since prewarm
+    voices: VoiceRegistry = ctx.proc.userdata["voice_catalogue"].current()
+    embedder: Embedder = ctx.proc.userdata["embedder"]
+    http_client: SharedHttpClient = ctx.proc.userdata["http_client"]
+    http_client.acquire()
+    ctx.add_shutdown_callback(http_client.release)
+    if "metrics_exporter" in ctx.proc.userdata:
+        ctx.add_shutdown_callback(ctx.proc.userdata["metrics_exporter"].flush)
     fnc_ctx = llm.FunctionContext()
-    tts = cartesia.TTS(
-        voice="248be419-c632-4f23-adf1-5324ed7dbf1d",
-        model="sonic",
+    tts = CachedTTS(
+        cartesia.TTS(voice=DEFAULT_VOICE, model=DEFAULT_TTS_MODEL),
+        ctx.proc.userdata["phrase_cache"],
+        phrases=canned_phrases,
     )
     agent = VoicePipelineAgent(
         vad=ctx.proc.userdata["vad"],
@@ -118,11 +508,41 @@ async def entrypoint(ctx: JobContext):
         tts=tts,
         chat_ctx=create_initial_chat_context(),
         fnc_ctx=fnc_ctx,
+        before_tts_cb=_before_tts,
     ) 
 
-    
-    is_user_speaking = False
-    is_agent_speaking = False
+
+    speculative = None
+    if rag_speculative:
+        speculative = SpeculativeRetrieval(
+            lambda text: get_retriever().search(text, embedder, TurnTimings(), k=rag_top_k)
+        )
+    # everything mutable about this call lives in its session, not the process
+    history = ChatHistory(
+        agent,
+        token_budget=chat_context_token_budget,
+        keep_messages=chat_context_keep_messages,
+        summarize=chat_context_summarize,
+    )
+    session = AgentSession(ctx, agent, embedder, speculative, history)
+    transcripts_source = None
+
+    def _follow_transcripts():
+        # the agent creates its STT input when the participant is linked, so
+        # subscribe to its transcripts once the user is first heard
+        nonlocal transcripts_source
+        human_input = getattr(agent, "_human_input", None)
+        if speculative is None or human_input is None or human_input is transcripts_source:
+            return
+        transcripts_source = human_input
+        human_input.on(
+            "interim_transcript",
+            lambda ev: speculative.update(ev.alternatives[0].text),
+        )
+        human_input.on(
+            "final_transcript",
+            lambda ev: speculative.update(ev.alternatives[0].text, final=True),
+        )
 
     @fnc_ctx.ai_callable()
     async def connect_to_human_agent(
@@ -134,20 +554,22 @@ async def entrypoint(ctx: JobContext):
         Called when you need to connect to a human agent.
         """
         logger.info("Connecting to a human agent")
-        try:
-            # add a speech before disconnecting
-            await agent.say("I'm transferring you to a human agent. Please hold on.", allow_interruptions=False)
-            await asyncio.sleep(5)
-            # Send RPC to all standard participants to end the call
-            await ctx.room.local_participant.publish_data(
-                "endCall",
-                topic="endCall",
-            )
-            logger.info("Successfully notified frontend to end call")
-            return "Successfully notified frontend to end call"
-        except Exception as e:
-            logger.error(f"Failed to notify frontend: {str(e)}")
-            return "Failed to notify frontend"
+        pipeline_metrics.escalations.inc()
+        with pipeline_metrics.time_tool_call("connect_to_human_agent"):
+            try:
+                # add a speech before disconnecting
+                await agent.say(TRANSFER_PHRASE, allow_interruptions=False)
+                await asyncio.sleep(5)
+                # Send RPC to all standard participants to end the call
+                await ctx.room.local_participant.publish_data(
+                    "endCall",
+                    topic="endCall",
+                )
+                logger.info("Successfully notified frontend to end call")
+                return "Successfully notified frontend to end call"
+            except Exception as e:
+                logger.error(f"Failed to notify frontend: {str(e)}")
+                return "Failed to notify frontend"
 
     # Define the function to enrich with RAG
     @fnc_ctx.ai_callable()
@@ -160,15 +582,8 @@ async def entrypoint(ctx: JobContext):
         Called when you need to enrich with RAG for questions about Wise.
         """
         logger.info("Enriching with RAG for questions about Wise")
-        async with _chat_ctx_lock:
-            thinking_ctx = llm.ChatContext().append(
-                role="system",
-                text="Generate a very short message to indicate that we're looking up the answer in the docs"
-            )
-            thinking_stream = agent._llm.chat(chat_ctx=thinking_ctx)
-            # Wait for thinking message to complete before proceeding
-            await agent.say(thinking_stream, add_to_chat_ctx=False)
-        await _enrich_with_rag(agent, agent.chat_ctx)
+        with pipeline_metrics.time_tool_call("enrich_with_rag"):
+            await _answer_with_rag(session, TurnTimings(budget=rag_latency_budget))
 
     @ctx.room.on("participant_attributes_changed")
     def on_participant_attributes_changed(
@@ -186,61 +601,68 @@ async def entrypoint(ctx: JobContext):
             if not voice_id:
                 return
 
-            voice_data = next(
-                (voice for voice in cartesia_voices if voice["id"] == voice_id), None
-            )
-            if not voice_data:
+            voice = voices.get(voice_id)
+            if not voice:
                 logger.warning(f"Voice {voice_id} not found")
                 return
-            if "embedding" in voice_data:
-                language = "en"
-                if "language" in voice_data and voice_data["language"] != "en":
-                    language = voice_data["language"]
-                agent.tts._opts.voice = voice_data["embedding"]
-                agent.tts._opts.language = language
-                # allow user to confirm voice change as long as no one is speaking
-                if not (is_agent_speaking or is_user_speaking):
-                    asyncio.create_task(
-                        agent.say("How do I sound now?", allow_interruptions=True)
-                    )
+            # by embedding when the voice list has one, otherwise by id
+            agent.tts._opts.voice = voice.embedding if voice.embedding is not None else voice.id
+            agent.tts._opts.language = voice.language
+            pipeline_metrics.voice_changes.inc()
+            # allow user to confirm voice change as long as no one is speaking
+            if not (session.is_agent_speaking or session.is_user_speaking):
+                asyncio.create_task(
+                    agent.say(VOICE_CHANGE_PHRASE, allow_interruptions=True)
+                )
+            if tts_cache_warm_on_voice_change:
+                if session.voice_warmup and not session.voice_warmup.done():
+                    session.voice_warmup.cancel()
+                session.voice_warmup = asyncio.create_task(tts.warm(canned_phrases))
 
     await ctx.connect()
 
     @agent.on("agent_started_speaking")
     def agent_started_speaking():
-        nonlocal is_agent_speaking
-        is_agent_speaking = True
+        session.is_agent_speaking = True
+        if session.user_stopped_speaking_at is not None:
+            pipeline_metrics.end_of_speech_to_first_audio.observe(
+                time.perf_counter() - session.user_stopped_speaking_at
+            )
+            session.user_stopped_speaking_at = None
+        if speculative:
+            speculative.end_utterance()
 
     @agent.on("agent_stopped_speaking")
     def agent_stopped_speaking():
-        nonlocal is_agent_speaking
-        is_agent_speaking = False
+        session.is_agent_speaking = False
 
     @agent.on("user_started_speaking")
     def user_started_speaking():
-        nonlocal is_user_speaking
-        is_user_speaking = True
+        session.is_user_speaking = True
+        _follow_transcripts()
 
     @agent.on("user_stopped_speaking")
     def user_stopped_speaking():
-        nonlocal is_user_speaking
-        is_user_speaking = False
+        session.is_user_speaking = False
+        session.user_stopped_speaking_at = time.perf_counter()
+
+    @agent.on("agent_speech_committed")
+    def agent_speech_committed(msg: llm.ChatMessage):
+        # the reply is in the chat context now; keep it within its budget
+        session.history.maintain()
+
+    @agent.on("metrics_collected")
+    def on_metrics_collected(mtrcs: metrics.AgentMetrics):
+        _record_metrics(session, mtrcs)
 
     # set voice listing as attribute for UI
-    voices = []
-    for voice in cartesia_voices:
-        voices.append(
-            {
-                "id": voice["id"],
-                "name": voice["name"],
-            }
-        )
-    voices.sort(key=lambda x: x["name"])
-    await ctx.room.local_participant.set_attributes({"voices": json.dumps(voices)})
+    await ctx.room.local_participant.set_attributes({"voices": voices.attribute_payload})
 
     agent.start(ctx.room)
-    await agent.say("Hi there, I am Claire from Wise. How can I help you today?", allow_interruptions=True)
+    await agent.say(GREETING, allow_interruptions=True)
 
 
 if __name__ == "__main__":
+    if metrics_port:
+        pipeline_metrics.start_metrics_server(metrics_host, metrics_port, metrics_dir)
     cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint, prewarm_fnc=prewarm))
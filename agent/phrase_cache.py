@@ -0,0 +1,411 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+import aiohttp
+from livekit import rtc
+from livekit.agents import tts, utils
+from livekit.agents.log import logger
+
+# Cached audio is replayed in frames of this length
+_FRAME_MS = 50
+
+
+def tts_cache_key(tts_opts, sample_rate: int, text: str) -> str:
+    """
+    Cache key for a phrase synthesized with the given TTS options: voice id
+    or embedding, language, model and output format.
+    """
+    payload = json.dumps(
+        [tts_opts.voice, tts_opts.language, tts_opts.model, sample_rate, text]
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PhraseCache:
+    """
+    In-memory and on-disk cache of synthesized 16-bit PCM audio, shared by
+    every job in the process (and by all processes through the directory).
+
+    Canned phrases are pinned: kept for the life of the process and never
+    pruned from disk. Other audio (answers replayed from the response cache)
+    is kept in `answers/`, expires after `answer_ttl` seconds and is evicted
+    least recently used first beyond `answer_max_bytes`, in memory and on
+    disk alike.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        answer_max_bytes: int = 64 * 1024 * 1024,
+        answer_ttl: Optional[float] = 86400.0,
+    ):
+        self.directory = directory
+        self.answers_directory = os.path.join(directory, "answers")
+        os.makedirs(self.answers_directory, exist_ok=True)
+        self.answer_max_bytes = answer_max_bytes
+        self.answer_ttl = answer_ttl
+        self._memory: dict[str, bytes] = {}
+        # key -> (time stored, pcm), least recently used first
+        self._answers: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._answer_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str, pinned: bool = True) -> str:
+        return os.path.join(self.directory if pinned else self.answers_directory, f"{key}.pcm")
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.answer_ttl is not None and time.time() - stored_at >= self.answer_ttl
+
+    def _remember_answer(self, key: str, pcm: bytes, stored_at: float) -> None:
+        with self._lock:
+            old = self._answers.pop(key, None)
+            if old is not None:
+                self._answer_bytes -= len(old[1])
+            self._answers[key] = (stored_at, pcm)
+            self._answer_bytes += len(pcm)
+            while self._answer_bytes > self.answer_max_bytes and self._answers:
+                _, (_, evicted) = self._answers.popitem(last=False)
+                self._answer_bytes -= len(evicted)
+
+    def _get_answer(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._answers.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._answers.move_to_end(key)
+                    return entry[1]
+                del self._answers[key]
+                self._answer_bytes -= len(entry[1])
+        path = self._path(key, pinned=False)
+        try:
+            stored_at = os.path.getmtime(path)
+            if self._expired(stored_at):
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                pcm = f.read()
+        except FileNotFoundError:
+            return None
+        self._remember_answer(key, pcm, stored_at)
+        return pcm
+
+    def get(self, key: str) -> Optional[bytes]:
+        pcm = self._memory.get(key)
+        if pcm is None:
+            try:
+                with open(self._path(key), "rb") as f:
+                    pcm = self._memory[key] = f.read()
+            except FileNotFoundError:
+                pcm = self._get_answer(key)
+        if pcm is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pcm
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._memory or os.path.exists(self._path(key))
+
+    def put(self, key: str, pcm: bytes, pinned: bool = True) -> None:
+        if pinned:
+            self._memory[key] = pcm
+        else:
+            self._remember_answer(key, pcm, time.time())
+        path = self._path(key, pinned)
+        tmp_path = path + f".{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(pcm)
+        os.replace(tmp_path, path)
+        if not pinned:
+            self._prune_answers()
+
+    def _prune_answers(self) -> None:
+        """
+        Delete expired answer audio from disk, then the least recently
+        written files while the directory is over `answer_max_bytes`.
+        """
+        files = []
+        for entry in os.scandir(self.answers_directory):
+            if not entry.name.endswith(".pcm"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if not self._expired(mtime) and total <= self.answer_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._memory) + len(self._answers),
+            "answer_bytes": self._answer_bytes,
+        }
+
+
+class _CachedAudioStream:
+    """
+    Replays cached PCM with the interface of a TTS ChunkedStream.
+    """
+
+    def __init__(self, pcm: bytes, sample_rate: int, num_channels: int):
+        self._pcm = pcm
+        self._sample_rate = sample_rate
+        self._num_channels = num_channels
+        self._request_id = utils.shortuuid()
+        self._offset = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> tts.SynthesizedAudio:
+        frame_bytes = self._sample_rate * _FRAME_MS // 1000 * self._num_channels * 2
+        if self._offset >= len(self._pcm):
+            raise StopAsyncIteration
+        data = self._pcm[self._offset : self._offset + frame_bytes]
+        self._offset += len(data)
+        return tts.SynthesizedAudio(
+            request_id=self._request_id,
+            frame=rtc.AudioFrame(
+                data=data,
+                sample_rate=self._sample_rate,
+                num_channels=self._num_channels,
+                samples_per_channel=len(data) // (2 * self._num_channels),
+            ),
+        )
+
+    async def aclose(self) -> None:
+        pass
+
+
+class _RecordingStream:
+    """
+    Passes a TTS ChunkedStream through and stores its audio once the whole
+    phrase has been synthesized.
+    """
+
+    def __init__(self, stream, cache: PhraseCache, key: str, pinned: bool = True):
+        self._stream = stream
+        self._cache = cache
+        self._key = key
+        self._pinned = pinned
+        self._pcm = bytearray()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> tts.SynthesizedAudio:
+        try:
+            audio = await self._stream.__anext__()
+        except StopAsyncIteration:
+            if self._pcm:
+                self._cache.put(self._key, bytes(self._pcm), pinned=self._pinned)
+            raise
+        self._pcm.extend(audio.frame.data.cast("B"))
+        return audio
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+
+class _CachedSynthesizeStream:
+    """
+    The TTS stream handed to the agent. A text pushed and ended in one go,
+    which is how livekit-agents 0.12.17 and later speak `say()` strings, is
+    served like `synthesize()`: from the phrase cache, or recorded into it if
+    it is a known phrase. Anything else goes to the wrapped TTS stream, which
+    is flushed after every pushed text: the agent pushes streamed replies as
+    speakable chunks, and the TTS's own sentence tokenizer would otherwise
+    hold each chunk back until the next sentence starts.
+    """
+
+    def __init__(self, owner: "CachedTTS", args, kwargs):
+        self._owner = owner
+        self._args = args
+        self._kwargs = kwargs
+        self._pending: List[str] = []
+        self._ended = False
+        self._scheduled = False
+        self._stream = None
+        self._source = None
+        self._ready = asyncio.Event()
+
+    def push_text(self, text: str) -> None:
+        if self._stream is not None:
+            self._stream.push_text(text)
+            self._stream.flush()
+            return
+        self._pending.append(text)
+        self._schedule()
+
+    def flush(self) -> None:
+        # pushed texts are flushed already
+        pass
+
+    def end_input(self) -> None:
+        self._ended = True
+        if self._stream is not None:
+            self._stream.end_input()
+        else:
+            self._schedule()
+
+    def _schedule(self) -> None:
+        # decide once the caller yields to the event loop, so that a push
+        # directly followed by end_input() is seen as a single text
+        if not self._scheduled:
+            self._scheduled = True
+            asyncio.get_running_loop().call_soon(self._start)
+
+    def _start(self) -> None:
+        if self._ended and len(self._pending) == 1:
+            self._source = self._owner.synthesize(self._pending[0])
+        else:
+            self._stream = self._source = self._owner._wrapped.stream(*self._args, **self._kwargs)
+            for text in self._pending:
+                self.push_text(text)
+            if self._ended:
+                self._stream.end_input()
+        self._pending = []
+        self._ready.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> tts.SynthesizedAudio:
+        await self._ready.wait()
+        return await self._source.__anext__()
+
+    async def aclose(self) -> None:
+        if self._source is not None:
+            await self._source.aclose()
+
+
+class CachedTTS:
+    """
+    Wraps the agent's TTS so that canned phrases are played straight from
+    the phrase cache, whether they are spoken with `synthesize()` or
+    `stream()`. Phrases in `phrases` are recorded into the cache the first
+    time they are synthesized, and so are texts in `answers`, which the cache
+    may evict. Everything else goes to the wrapped TTS, with streamed LLM
+    output synthesized chunk by chunk.
+    """
+
+    def __init__(self, wrapped: tts.TTS, cache: PhraseCache, phrases: Iterable[str] = ()):
+        self._wrapped = wrapped
+        self._cache = cache
+        self.phrases = set(phrases)
+        self.answers: set[str] = set()
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+    def _key(self, text: str) -> str:
+        return tts_cache_key(self._wrapped._opts, self._wrapped.sample_rate, text)
+
+    def synthesize(self, text: str, *args, **kwargs):
+        key = self._key(text)
+        pcm = self._cache.get(key)
+        if pcm is not None:
+            return _CachedAudioStream(pcm, self._wrapped.sample_rate, self._wrapped.num_channels)
+        stream = self._wrapped.synthesize(text, *args, **kwargs)
+        if text in self.phrases:
+            return _RecordingStream(stream, self._cache, key)
+        if text in self.answers:
+            return _RecordingStream(stream, self._cache, key, pinned=False)
+        return stream
+
+    def stream(self, *args, **kwargs):
+        return _CachedSynthesizeStream(self, args, kwargs)
+
+    async def warm(self, texts: Iterable[str]) -> None:
+        """
+        Synthesize any of `texts` missing from the cache for the current voice.
+        Stops early if the voice is changed again meanwhile.
+        """
+        voice = self._wrapped._opts.voice
+        for text in texts:
+            if self._wrapped._opts.voice != voice:
+                return
+            self.phrases.add(text)
+            key = self._key(text)
+            if key in self._cache:
+                continue
+            stream = _RecordingStream(self._wrapped.synthesize(text), self._cache, key)
+            try:
+                async for _ in stream:
+                    pass
+            except Exception as e:
+                logger.warning(f"failed to pre-synthesize {text!r}: {e}")
+            finally:
+                await stream.aclose()
+
+
+def warm_phrase_cache(
+    cache: PhraseCache,
+    phrases: Iterable[str],
+    timeout: float = 0.0,
+    lock_timeout: float = 300.0,
+    **tts_kwargs,
+) -> None:
+    """
+    Pre-synthesize phrases for the default voice from a synchronous context
+    (the process prewarm). Runs on its own thread and event loop and waits
+    at most `timeout` seconds (by default not at all) before letting it
+    finish in the background.
+
+    Only one process warms the cache directory at a time; the others skip
+    warming and read the phrases from disk once they are written. A lock
+    older than `lock_timeout` seconds is taken to be left behind by a
+    process that died mid-warm.
+    """
+    phrases = list(phrases)
+    lock_path = os.path.join(cache.directory, ".warm.lock")
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(lock_path) < lock_timeout:
+                return
+            os.remove(lock_path)
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except (FileNotFoundError, FileExistsError):
+            return
+    os.close(fd)
+
+    async def _warm() -> None:
+        try:
+            async with aiohttp.ClientSession() as session:
+                from livekit.plugins import cartesia
+
+                cached = CachedTTS(cartesia.TTS(http_session=session, **tts_kwargs), cache)
+                await cached.warm(phrases)
+        finally:
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+
+    thread = threading.Thread(target=asyncio.run, args=(_warm(),), daemon=True)
+    thread.start()
+    if timeout > 0:
+        thread.join(timeout)
+    if thread.is_alive():
+        logger.info("phrase cache warming in the background")
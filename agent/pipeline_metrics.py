@@ -0,0 +1,492 @@
+import bisect
+import json
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Iterable, List, Optional, Sequence
+
+from livekit.agents.log import logger
+
+from turn_timing import TurnTimings
+
+# Room and session of the job a trace span is written for. Set once at the
+# start of a job; the agent's tasks and event handlers inherit it. Metrics
+# are not labelled with them: the worker exports the sum of all its jobs.
+session_labels: ContextVar[dict[str, str]] = ContextVar(
+    "session_labels", default={"room": "", "session": ""}
+)
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+DISTANCE_BUCKETS = (0.2, 0.4, 0.6, 0.8, 1.0, 1.2, 1.4, 1.6, 2.0)
+
+# Metric snapshots of job processes, `<pid>.json`, in the metrics directory
+_SNAPSHOT_NAME = re.compile(r"^(\d+)\.json$")
+# Snapshots of job processes that exited, summed
+_ARCHIVE_NAME = "archive.json"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _snapshot(self, series: List[list]) -> dict[str, Any]:
+        return {
+            "type": self.type,
+            "help": self.help,
+            "labelnames": list(self.labelnames),
+            "series": series,
+        }
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return self._snapshot([[list(key), value] for key, value in self._values.items()])
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: bucket counts (the last one is +Inf), sum
+        self._series: dict[tuple[str, ...], tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            snapshot = self._snapshot(
+                [
+                    [list(key), {"counts": list(counts), "sum": total[0]}]
+                    for key, (counts, total) in self._series.items()
+                ]
+            )
+        snapshot["buckets"] = list(self.buckets)
+        return snapshot
+
+
+class CallbackCounter:
+    """
+    Process-wide counter read from existing statistics (e.g. a cache's
+    `stats()`) when snapshotted: `collect` returns `{label value: count}`.
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelname: str, collect: Callable[[], dict[str, float]]):
+        self.name = name
+        self.help = help
+        self.labelname = labelname
+        self.collect = collect
+
+    def snapshot(self) -> dict[str, Any]:
+        try:
+            values = self.collect()
+        except Exception as e:
+            logger.warning(f"failed to collect {self.name}: {e}")
+            values = {}
+        return {
+            "type": self.type,
+            "help": self.help,
+            "labelnames": [self.labelname],
+            "series": [[[label], value] for label, value in values.items()],
+        }
+
+
+def merge_snapshots(snapshots: Iterable[dict[str, dict[str, Any]]]) -> dict[str, dict[str, Any]]:
+    """
+    Sum registry snapshots of several processes, series by series.
+    """
+    merged: dict[str, dict[str, Any]] = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            into = merged.setdefault(name, {**metric, "series": []})
+            series = {tuple(key): value for key, value in into["series"]}
+            for key, value in metric["series"]:
+                key = tuple(key)
+                if key not in series:
+                    series[key] = value
+                elif metric["type"] == "histogram":
+                    old = series[key]
+                    series[key] = {
+                        "counts": [a + b for a, b in zip(old["counts"], value["counts"])],
+                        "sum": old["sum"] + value["sum"],
+                    }
+                else:
+                    series[key] = series[key] + value
+            into["series"] = [[list(key), value] for key, value in series.items()]
+    return merged
+
+
+def render_snapshot(snapshot: dict[str, dict[str, Any]]) -> str:
+    """
+    Prometheus text exposition of a registry snapshot.
+    """
+    lines = []
+    for name, metric in snapshot.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labelnames = metric["labelnames"]
+        for key, value in metric["series"]:
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + [math.inf], value["counts"]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{name}_bucket{_format_labels(labelnames, key, le)} {cumulative}")
+            labels = _format_labels(labelnames, key)
+            lines.append(f"{name}_sum{labels} {_format_value(value['sum'])}")
+            lines.append(f"{name}_count{labels} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def render(self) -> str:
+        return render_snapshot(self.snapshot())
+
+
+registry = Registry()
+
+end_of_speech_to_first_audio = registry.register(
+    Histogram(
+        "voice_agent_end_of_speech_to_first_audio_seconds",
+        "Time from the end of the user's speech to the agent's first audio.",
+    )
+)
+embedding_latency = registry.register(
+    Histogram("voice_agent_embedding_seconds", "Query embedding latency of RAG turns.")
+)
+ann_query_latency = registry.register(
+    Histogram("voice_agent_ann_query_seconds", "Vector index query latency of RAG turns.")
+)
+retrieved_distance = registry.register(
+    Histogram(
+        "voice_agent_retrieved_distance",
+        "Angular distance of retrieved passages from the question.",
+        buckets=DISTANCE_BUCKETS,
+    )
+)
+llm_ttft = registry.register(
+    Histogram("voice_agent_llm_ttft_seconds", "LLM time to first token.")
+)
+tts_ttfb = registry.register(
+    Histogram("voice_agent_tts_ttfb_seconds", "TTS time to first byte.")
+)
+tool_call_duration = registry.register(
+    Histogram("voice_agent_tool_call_seconds", "Duration of tool calls.", ["tool"])
+)
+cache_requests = registry.register(
+    Counter(
+        "voice_agent_cache_requests_total",
+        "Cache lookups of the agent sessions by cache and result (hit or miss).",
+        ["cache", "result"],
+    )
+)
+escalations = registry.register(
+    Counter("voice_agent_escalations_total", "Calls transferred to a human agent.")
+)
+voice_changes = registry.register(
+    Counter("voice_agent_voice_changes_total", "Voice changes requested by the user.")
+)
+
+
+@contextmanager
+def time_tool_call(tool: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        tool_call_duration.observe(time.perf_counter() - start, tool=tool)
+
+
+def register_cache_stats(caches: dict[str, Callable[[], dict[str, int]]]) -> None:
+    """
+    Expose the hit and miss counts of process-wide caches, given as
+    `{cache name: stats function}`.
+    """
+
+    def collect(field: str) -> Callable[[], dict[str, float]]:
+        return lambda: {name: stats()[field] for name, stats in caches.items()}
+
+    registry.register(
+        CallbackCounter(
+            "voice_agent_process_cache_hits_total", "Hits of process-wide caches.", "cache", collect("hits")
+        )
+    )
+    registry.register(
+        CallbackCounter(
+            "voice_agent_process_cache_misses_total",
+            "Misses of process-wide caches.",
+            "cache",
+            collect("misses"),
+        )
+    )
+
+
+def _write_json_atomic(path: str, data) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsExporter:
+    """
+    Writes this process's registry snapshot to `<directory>/<pid>.json`
+    every `interval` seconds (when it changed), for the metrics server of
+    the worker to add up. Job processes are short-lived and cannot serve
+    their metrics themselves.
+    """
+
+    def __init__(self, directory: str, interval: float = 1.0):
+        self.path = os.path.join(directory, f"{os.getpid()}.json")
+        self.interval = interval
+        self._last: Optional[dict] = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.write()
+
+    def write(self) -> None:
+        with self._lock:
+            snapshot = registry.snapshot()
+            if snapshot == self._last:
+                return
+            try:
+                _write_json_atomic(self.path, snapshot)
+            except OSError as e:
+                logger.warning(f"failed to write metrics snapshot: {e}")
+                return
+            self._last = snapshot
+
+    async def flush(self) -> None:
+        # job shutdown callback: the process exits right after
+        self.write()
+
+
+class MetricsCollector:
+    """
+    Adds up the snapshots the job processes write to `directory`. Snapshots
+    of processes that exited are folded into one archive file, so their
+    counts stay in the totals while the directory stays small.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        # a new worker starts its counters from zero
+        os.makedirs(self.directory, exist_ok=True)
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json") or entry.name.endswith(".tmp"):
+                os.remove(entry.path)
+
+    def collect(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            archive_path = os.path.join(self.directory, _ARCHIVE_NAME)
+            archive = _read_json(archive_path) or {}
+            live, exited = [], []
+            for entry in os.scandir(self.directory):
+                match = _SNAPSHOT_NAME.match(entry.name)
+                if match is None:
+                    continue
+                snapshot = _read_json(entry.path)
+                if snapshot is None:
+                    continue
+                if _process_alive(int(match.group(1))):
+                    live.append(snapshot)
+                else:
+                    exited.append((entry.path, snapshot))
+            if exited:
+                archive = merge_snapshots([archive] + [snapshot for _, snapshot in exited])
+                _write_json_atomic(archive_path, archive)
+                for path, _ in exited:
+                    os.remove(path)
+            return merge_snapshots([archive] + live)
+
+    def render(self) -> str:
+        return render_snapshot(self.collect())
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.collector.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host: str, port: int, directory: str) -> Optional[int]:
+    """
+    Serve the sum of the job processes' snapshots in `directory` at
+    http://host:port/metrics from a background thread. Runs once, in the
+    worker's main process; clears snapshots left by an earlier worker.
+    Returns the port, or None if it could not be bound.
+    """
+    collector = MetricsCollector(directory)
+    collector.reset()
+    try:
+        server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as e:
+        logger.warning(f"failed to serve metrics on {host}:{port}: {e}")
+        return None
+    server.collector = collector
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    logger.info(f"serving metrics on http://{host}:{port}/metrics")
+    return port
+
+
+def export_metrics(directory: str, interval: float = 1.0) -> MetricsExporter:
+    """
+    Start writing this job process's metrics for the worker's server.
+    """
+    return MetricsExporter(directory, interval)
+
+
+class TraceWriter:
+    """
+    Appends one JSON line per RAG turn: its labels, start time, stages and
+    counters.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, turn: TurnTimings) -> None:
+        span = {
+            **session_labels.get(),
+            "name": "rag_turn",
+            "pid": os.getpid(),
+            "start": time.time() - turn.elapsed(),
+            "duration": turn.elapsed(),
+            "speech_id": turn.speech_id,
+            "timed_out": turn.timed_out,
+            "stages": turn.stages,
+            "counters": turn.counters,
+        }
+        line = json.dumps(span) + "\n"
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
+
+
+_tracer: Optional[TraceWriter] = None
+
+
+def enable_tracing(path: str) -> None:
+    global _tracer
+    _tracer = TraceWriter(path)
+
+
+def record_turn(turn: TurnTimings) -> None:
+    """
+    Record the stage histograms of a finished RAG turn, and its trace span
+    when tracing is enabled.
+    """
+    if "embed" in turn.stages:
+        embedding_latency.observe(turn.stages["embed"])
+    if "ann_query" in turn.stages:
+        ann_query_latency.observe(turn.stages["ann_query"])
+    if _tracer is not None:
+        try:
+            _tracer.write(turn)
+        except OSError as e:
+            logger.warning(f"failed to write trace span: {e}")
@@ -0,0 +1,131 @@
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Sequence
+
+import numpy as np
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize a user utterance for use as a cache key: lowercase, no
+    punctuation, single spaces.
+    """
+    text = _PUNCTUATION_RE.sub(" ", text.lower())
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+class TTLCache:
+    """
+    In-process LRU cache whose entries also expire after `ttl` seconds.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: Optional[float] = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._data.get(key)
+        if entry is not None:
+            stored_at, value = entry
+            if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+class SemanticCache:
+    """
+    Maps query embeddings to a cached value (e.g. the id of the retrieved
+    document). A lookup hits when the closest cached embedding lies within
+    `max_distance` cosine distance of the query.
+    """
+
+    def __init__(
+        self, max_distance: float = 0.08, maxsize: int = 256, ttl: Optional[float] = 3600.0
+    ):
+        self.max_distance = max_distance
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._values: list[Any] = []
+        self._stored_at: list[float] = []
+
+    @staticmethod
+    def _unit(vec: Sequence[float]) -> np.ndarray:
+        arr = np.asarray(vec, dtype=np.float32)
+        norm = np.linalg.norm(arr)
+        return arr / norm if norm else arr
+
+    def _evict_expired(self) -> None:
+        if self.ttl is None or not self._values:
+            return
+        now = time.monotonic()
+        keep = [i for i, t in enumerate(self._stored_at) if now - t < self.ttl]
+        if len(keep) == len(self._values):
+            return
+        self._vectors = self._vectors[keep] if keep else None
+        self._values = [self._values[i] for i in keep]
+        self._stored_at = [self._stored_at[i] for i in keep]
+
+    def get(self, vec: Sequence[float]) -> tuple[Any, Optional[float]]:
+        """
+        Return `(value, distance)` of the closest cached entry, or
+        `(None, None)` on a miss.
+        """
+        self._evict_expired()
+        if self._vectors is not None:
+            similarities = self._vectors @ self._unit(vec)
+            best = int(np.argmax(similarities))
+            distance = 1.0 - float(similarities[best])
+            if distance <= self.max_distance:
+                self.hits += 1
+                return self._values[best], distance
+        self.misses += 1
+        return None, None
+
+    def put(self, vec: Sequence[float], value: Any) -> None:
+        unit = self._unit(vec)[np.newaxis, :]
+        if self._vectors is None:
+            self._vectors = unit
+        else:
+            self._vectors = np.vstack([self._vectors, unit])
+        self._values.append(value)
+        self._stored_at.append(time.monotonic())
+        if len(self._values) > self.maxsize:
+            # entries are appended in insertion order, so the oldest is first
+            self._vectors = self._vectors[1:]
+            self._values.pop(0)
+            self._stored_at.pop(0)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._values)}
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, AsyncIterable, Optional
+
+from rag_cache import TTLCache, normalize_query
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+class MemoryBackend:
+    """
+    Per-process response store.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 86400.0):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key: str) -> Optional[dict[str, Any]]:
+        return self._cache.get(key)
+
+    def put(self, key: str, value: dict[str, Any]) -> None:
+        self._cache.put(key, value)
+
+    def delete(self, key: str) -> None:
+        self._cache.delete(key)
+
+
+class FileBackend:
+    """
+    Response store shared by all worker processes: one JSON file per entry
+    in `directory`, written atomically.
+    """
+
+    def __init__(self, directory: str, ttl: Optional[float] = 86400.0):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{text_hash(key)}.json")
+
+    def get(self, key: str) -> Optional[dict[str, Any]]:
+        try:
+            with open(self._path(key), "r") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if entry.get("key") != key:
+            return None
+        if self.ttl is not None and time.time() - entry["stored_at"] >= self.ttl:
+            self.delete(key)
+            return None
+        return entry["value"]
+
+    def put(self, key: str, value: dict[str, Any]) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"key": key, "stored_at": time.time(), "value": value}, f)
+        os.replace(tmp_path, path)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class ResponseCache:
+    """
+    Final answers to FAQ questions, keyed on the top retrieved document, the
+    normalized question and the system prompt version. Each entry remembers
+    the hash of the document content it was generated from and is dropped
+    when the document changes.
+    """
+
+    def __init__(self, backend, prompt_version: str):
+        self.backend = backend
+        self.prompt_version = prompt_version
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, doc_id: str, question: str) -> str:
+        return json.dumps([doc_id, normalize_query(question), self.prompt_version])
+
+    def get(self, doc_id: str, question: str, content_hash: str) -> Optional[str]:
+        key = self._key(doc_id, question)
+        entry = self.backend.get(key)
+        if entry is not None and entry["content_hash"] != content_hash:
+            self.backend.delete(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["answer"]
+
+    def put(self, doc_id: str, question: str, content_hash: str, answer: str) -> None:
+        answer = answer.strip()
+        if answer:
+            self.backend.put(
+                self._key(doc_id, question), {"content_hash": content_hash, "answer": answer}
+            )
+
+    async def record(
+        self, text: AsyncIterable[str], doc_id: str, question: str, content_hash: str
+    ) -> AsyncIterable[str]:
+        """
+        Pass an answer stream through and cache the answer once it has been
+        generated in full; interrupted answers are not cached.
+        """
+        parts = []
+        async for chunk in text:
+            parts.append(chunk)
+            yield chunk
+        self.put(doc_id, question, content_hash, "".join(parts))
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,198 @@
+import math
+from dataclasses import dataclass
+from typing import List, Optional
+
+from livekit.agents.log import logger
+
+from chunking import chunk_document, estimate_tokens
+from embedders import Embedder
+from lexical import BM25Index, reciprocal_rank_fusion, tokenize
+from rag_cache import SemanticCache, TTLCache, normalize_query
+from turn_timing import TurnTimings
+from vector_index import QueryResult, VectorIndex
+
+
+@dataclass
+class Passage:
+    id: str
+    url: str
+    title: str
+    text: str
+    # angular distance from the question, inf when only matched lexically
+    distance: float = math.inf
+    # BM25 score, 0 when only matched by the vector index
+    lexical_score: float = 0.0
+
+
+class Retriever:
+    """
+    Top-k passage retrieval over the FAQ index. Query embeddings are cached
+    by normalized text, and near-duplicate queries reuse earlier results.
+    With a lexical index, vector and BM25 rankings are fused with reciprocal
+    rank fusion.
+    """
+
+    def __init__(
+        self,
+        index: VectorIndex,
+        documents,
+        embedding_cache: TTLCache,
+        results_cache: SemanticCache,
+        lexical: Optional[BM25Index] = None,
+    ):
+        self.index = index
+        self.documents = documents
+        self.embedding_cache = embedding_cache
+        self.results_cache = results_cache
+        self.lexical = lexical
+
+    def lexical_search(self, query: str, k: int = 4) -> List[QueryResult]:
+        """
+        BM25 lookup; needs no network call, so it can run before the query
+        embedding is available.
+        """
+        if self.lexical is None:
+            return []
+        return self.lexical.query(query, n=k)
+
+    def _passage(self, doc_id: str, **scores) -> Optional[Passage]:
+        doc = self.documents.get(doc_id)
+        if not doc:
+            return None
+        return Passage(
+            id=doc_id,
+            url=doc.get("url", ""),
+            title=doc.get("title", ""),
+            text=doc.get("content", ""),
+            **scores,
+        )
+
+    def lexical_passages(self, lexical_results: List[QueryResult]) -> List[Passage]:
+        passages = [self._passage(r.userdata, lexical_score=r.distance) for r in lexical_results]
+        return [p for p in passages if p]
+
+    async def embed(self, query: str, embedder: Embedder) -> List[float]:
+        cache_key = normalize_query(query)
+        embedding = self.embedding_cache.get(cache_key)
+        if embedding is None:
+            embedding = (await embedder.embed([query]))[0]
+            self.embedding_cache.put(cache_key, embedding)
+        return embedding
+
+    async def search(
+        self,
+        query: str,
+        embedder: Embedder,
+        turn: TurnTimings,
+        k: int = 4,
+        lexical_results: Optional[List[QueryResult]] = None,
+    ) -> List[Passage]:
+        if lexical_results is None:
+            with turn.stage("lexical"):
+                lexical_results = self.lexical_search(query, k)
+        with turn.stage("embed"):
+            embedding = await self.embed(query, embedder)
+        with turn.stage("ann_query"):
+            results, distance = self.results_cache.get(embedding)
+            if results is None or len(results) < k:
+                results = [
+                    (r.userdata, r.distance) for r in self.index.query(embedding, n=k)
+                ]
+                self.results_cache.put(embedding, results)
+            else:
+                logger.debug(f"retrieval cache hit at cosine distance {distance:.3f}")
+
+        distances = dict(results[:k])
+        lexical_scores = {r.userdata: r.distance for r in lexical_results}
+        if lexical_scores:
+            ranked = [
+                doc_id
+                for doc_id, _ in reciprocal_rank_fusion(
+                    [list(distances), list(lexical_scores)]
+                )
+            ]
+        else:
+            ranked = list(distances)
+
+        passages = []
+        for doc_id in ranked[:k]:
+            passage = self._passage(
+                doc_id,
+                distance=distances.get(doc_id, math.inf),
+                lexical_score=lexical_scores.get(doc_id, 0.0),
+            )
+            if passage:
+                passages.append(passage)
+        return passages
+
+    def cache_stats(self) -> dict[str, dict[str, int]]:
+        return {
+            "query_embedding": self.embedding_cache.stats(),
+            "retrieval": self.results_cache.stats(),
+        }
+
+
+def _excerpt(passage: Passage, token_budget: int, query: str) -> str:
+    """
+    Cut a passage longer than the whole budget (from an index of whole
+    articles) down to its chunks that share the most terms with the query,
+    in article order.
+    """
+    chunks = [
+        chunk["content"]
+        for chunk in chunk_document(
+            {"content": passage.text}, max_tokens=min(200, token_budget), overlap_tokens=0
+        )
+    ]
+    if not chunks:
+        return passage.text
+    terms = set(tokenize(query))
+    ranked = sorted(
+        range(len(chunks)), key=lambda i: (-len(terms & set(tokenize(chunks[i]))), i)
+    )
+    keep, used = [], 0
+    for i in ranked:
+        cost = estimate_tokens(chunks[i])
+        if used + cost <= token_budget:
+            keep.append(i)
+            used += cost
+    return "\n".join(chunks[i] for i in sorted(keep or ranked[:1]))
+
+
+def assemble_context(
+    passages: List[Passage], token_budget: int = 600, max_per_source: int = 1, query: str = ""
+) -> str:
+    """
+    Fill the token budget with the best-ranked passages, taking at most
+    `max_per_source` passages from any one source URL. Passages are grouped
+    under their article title in rank order of the source. A best passage
+    longer than the budget is cut down to its parts that best match `query`.
+    """
+    by_source: dict[str, List[str]] = {}
+    titles: dict[str, str] = {}
+    used = 0
+    for passage in passages:
+        source = passage.url or passage.id
+        selected = by_source.setdefault(source, [])
+        if len(selected) >= max_per_source:
+            continue
+        title_cost = 0 if selected else estimate_tokens(passage.title)
+        text = passage.text
+        cost = estimate_tokens(text) + title_cost
+        if used and used + cost > token_budget:
+            # a lower-ranked, shorter passage may still fit
+            continue
+        if not used and cost > token_budget:
+            # the best passage is always kept, within the budget
+            text = _excerpt(passage, max(token_budget - title_cost, 1), query)
+            cost = estimate_tokens(text) + title_cost
+        titles.setdefault(source, passage.title)
+        selected.append(text)
+        used += cost
+
+    sections = []
+    for source, selected in by_source.items():
+        if selected:
+            body = "\n\n".join(selected)
+            sections.append(f"{titles[source]}\n{body}" if titles[source] else body)
+    return "\n\n".join(sections)
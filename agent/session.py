@@ -0,0 +1,119 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from livekit.agents import JobContext
+from livekit.agents.pipeline import VoicePipelineAgent
+
+from chat_history import ChatHistory
+from embedders import Embedder
+import pipeline_metrics
+from speculative import SpeculativeRetrieval
+from turn_timing import TurnTimings
+
+
+class ChatContextSequencer:
+    """
+    Orders the tool calls of one session that mutate `agent.chat_ctx`.
+
+    Each call takes a ticket when it starts. The slow, read-only part of the
+    call (retrieval) runs concurrently with other calls, but the section that
+    edits the chat context and queues speech runs strictly in ticket order,
+    one at a time. A ticket that is abandoned (the call failed or was
+    cancelled before its turn) must be released with `done()` so later calls
+    are not held up; `done()` is idempotent.
+    """
+
+    def __init__(self):
+        self._next_ticket = 0
+        self._serving = 0
+        self._finished: set[int] = set()
+        self._cond = asyncio.Condition()
+
+    def ticket(self) -> int:
+        ticket = self._next_ticket
+        self._next_ticket += 1
+        return ticket
+
+    @asynccontextmanager
+    async def turn(self, ticket: int):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._serving == ticket)
+        try:
+            yield
+        finally:
+            await self.done(ticket)
+
+    async def done(self, ticket: int) -> None:
+        async with self._cond:
+            if ticket < self._serving:
+                return
+            self._finished.add(ticket)
+            while self._serving in self._finished:
+                self._finished.discard(self._serving)
+                self._serving += 1
+            self._cond.notify_all()
+
+
+class AgentSession:
+    """
+    Per-room state of one job: the agent, the ordering of its chat-context
+    edits and its in-flight RAG turn. Nothing here is shared between jobs
+    running in the same worker process.
+    """
+
+    def __init__(
+        self,
+        ctx: JobContext,
+        agent: VoicePipelineAgent,
+        embedder: Embedder,
+        speculative: Optional[SpeculativeRetrieval] = None,
+        history: Optional[ChatHistory] = None,
+    ):
+        self.ctx = ctx
+        self.agent = agent
+        self.embedder = embedder
+        self.speculative = speculative
+        self.history = history or ChatHistory(agent)
+        self.chat_ctx_sequencer = ChatContextSequencer()
+        # RAG turns awaiting their first audio, by the id of their answer speech
+        self.turns: dict[str, TurnTimings] = {}
+        self.is_user_speaking = False
+        self.is_agent_speaking = False
+        # perf_counter() when the user last stopped speaking, until the agent answers
+        self.user_stopped_speaking_at: Optional[float] = None
+        # pre-synthesis of canned phrases after a voice change
+        self.voice_warmup: Optional[asyncio.Task] = None
+
+    @property
+    def room_name(self) -> str:
+        return self.ctx.room.name
+
+    async def say_for_turn(self, turn: TurnTimings, source, **kwargs):
+        """
+        Queue the speech that answers a RAG turn and remember which turn it
+        belongs to, so its TTS metrics complete the turn's timings. Speech
+        played from the phrase cache has no TTS metrics; its turn is
+        completed when the speech ends.
+        """
+        handle = await self.agent.say(source, **kwargs)
+        turn.speech_id = handle.id
+        self.turns[handle.id] = turn
+        handle.join().add_done_callback(lambda _: self.complete_turn(handle.id))
+        return handle
+
+    def complete_turn(
+        self, speech_id: Optional[str], tts_first_byte: Optional[float] = None
+    ) -> Optional[TurnTimings]:
+        """
+        Log and record the timings of the turn answered by `speech_id`, the
+        first time this is called for it.
+        """
+        turn = self.turns.pop(speech_id, None) if speech_id else None
+        if turn is None:
+            return None
+        if tts_first_byte is not None:
+            turn.record("tts_first_byte", tts_first_byte)
+        turn.log()
+        pipeline_metrics.record_turn(turn)
+        return turn
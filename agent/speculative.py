@@ -0,0 +1,124 @@
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from livekit.agents.log import logger
+
+from rag_cache import normalize_query
+
+
+def similarity(a: str, b: str) -> float:
+    """
+    Jaccard similarity of the normalized word sets of two transcripts.
+    """
+    wa, wb = set(normalize_query(a).split()), set(normalize_query(b).split())
+    if not wa or not wb:
+        return 0.0
+    return len(wa & wb) / len(wa | wb)
+
+
+class SpeculativeRetrieval:
+    """
+    Runs retrieval on STT transcripts while the user is still talking, so the
+    result is ready (or in flight) by the time the RAG tool is invoked.
+
+    Interim and final transcripts of the current utterance are fed through
+    `update()`. Work starts once the transcript has `min_words` words and has
+    been stable for `debounce` seconds; an in-flight lookup is cancelled when
+    the transcript moves below `min_similarity` of the text it was started
+    for. `take()` returns the result whose text best matches the committed
+    question and clears the turn.
+    """
+
+    def __init__(
+        self,
+        retrieve: Callable[[str], Awaitable[Any]],
+        min_words: int = 3,
+        min_similarity: float = 0.8,
+        debounce: float = 0.15,
+        max_results: int = 4,
+    ):
+        self._retrieve = retrieve
+        self.min_words = min_words
+        self.min_similarity = min_similarity
+        self.debounce = debounce
+        self.max_results = max_results
+        self._finals: list[str] = []
+        self._current: Optional[str] = None
+        self._tasks: OrderedDict[str, asyncio.Task] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def update(self, text: str, final: bool = False) -> None:
+        transcript = " ".join(self._finals + [text]).strip()
+        if final and text.strip():
+            self._finals.append(text.strip())
+        if len(transcript.split()) < self.min_words:
+            return
+        if self._current is not None and similarity(self._current, transcript) >= self.min_similarity:
+            return
+
+        # the transcript changed substantially, the pending lookup is stale
+        if self._current is not None:
+            stale = self._tasks.get(self._current)
+            if stale is not None and not stale.done():
+                stale.cancel()
+                del self._tasks[self._current]
+
+        self._current = transcript
+        existing = self._tasks.pop(transcript, None)
+        if existing is not None and not existing.cancelled():
+            # the same text was looked up before (e.g. the user went back to
+            # it); reuse that lookup rather than orphaning it
+            self._tasks[transcript] = existing
+        else:
+            self._tasks[transcript] = asyncio.create_task(self._run(transcript))
+        while len(self._tasks) > self.max_results:
+            _, oldest = self._tasks.popitem(last=False)
+            oldest.cancel()
+
+    async def _run(self, transcript: str) -> Any:
+        await asyncio.sleep(self.debounce)
+        return await self._retrieve(transcript)
+
+    def end_utterance(self) -> None:
+        """
+        The user stopped talking and the agent replied; the next transcript
+        starts a new question. Finished results are kept until `take()`.
+        """
+        self._finals.clear()
+        self._current = None
+
+    async def take(self, question: str) -> Optional[Any]:
+        """
+        Return the speculative result for `question`, waiting for it if the
+        lookup is still running, or None when no transcript was close enough.
+        """
+        best, best_score = None, 0.0
+        for transcript in self._tasks:
+            score = similarity(transcript, question)
+            if score > best_score:
+                best, best_score = transcript, score
+        task = self._tasks.pop(best) if best is not None and best_score >= self.min_similarity else None
+        self.clear()
+
+        if task is None:
+            self.misses += 1
+            return None
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"speculative retrieval failed: {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def clear(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        self._finals.clear()
+        self._current = None
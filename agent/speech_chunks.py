@@ -0,0 +1,103 @@
+import re
+from dataclasses import dataclass
+from typing import AsyncIterable, Optional
+
+# sentence ends (with any closing quote or bracket) and line breaks
+_SENTENCE_END_RE = re.compile(r"[.!?]+[\"')\]]*\s+|\n+")
+# clause ends, used to cut the first chunk short and to split long sentences
+_CLAUSE_END_RE = re.compile(r"[,;:–—]\s+")
+_SPACE_RE = re.compile(r"\s+")
+
+_CODE_FENCE_RE = re.compile(r"```\w*")
+_LIST_MARKER_RE = re.compile(r"^\s*(?:[-*+•]|\d+[.)])\s+", re.MULTILINE)
+_HEADING_RE = re.compile(r"^\s*#+\s*", re.MULTILINE)
+_LINK_RE = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_EMPHASIS_RE = re.compile(r"\*\*|__|[*`]|~~")
+
+
+def strip_markdown(text: str) -> str:
+    """
+    Remove the markdown an LLM tends to produce (list markers, headings,
+    emphasis, code fences, links) so that it is not read out by the TTS.
+    """
+    text = _CODE_FENCE_RE.sub("", text)
+    text = _LIST_MARKER_RE.sub("", text)
+    text = _HEADING_RE.sub("", text)
+    text = _LINK_RE.sub(r"\1", text)
+    return _EMPHASIS_RE.sub("", text)
+
+
+@dataclass
+class ChunkPolicy:
+    # the first chunk is cut at the first clause boundary past this length,
+    # so synthesis starts as early as possible
+    first_min_chars: int = 20
+    # later chunks are whole sentences of at least this length
+    min_chars: int = 60
+    # longer runs without a sentence end are cut at a clause or a space
+    max_chars: int = 250
+
+
+def _split_at(buffer: str, pattern: re.Pattern, min_chars: int) -> Optional[int]:
+    for match in pattern.finditer(buffer):
+        if match.end() >= min_chars:
+            return match.end()
+    return None
+
+
+def _next_split(buffer: str, policy: ChunkPolicy, first: bool) -> Optional[int]:
+    if first:
+        ends = [
+            i
+            for i in (
+                _split_at(buffer, _SENTENCE_END_RE, policy.first_min_chars),
+                _split_at(buffer, _CLAUSE_END_RE, policy.first_min_chars),
+            )
+            if i is not None
+        ]
+        if ends:
+            return min(ends)
+    else:
+        split = _split_at(buffer, _SENTENCE_END_RE, policy.min_chars)
+        if split is not None:
+            return split
+
+    if len(buffer) <= policy.max_chars:
+        return None
+    head = buffer[: policy.max_chars]
+    clauses = [m.end() for m in _CLAUSE_END_RE.finditer(head)]
+    if clauses:
+        return clauses[-1]
+    space = head.rfind(" ")
+    return space + 1 if space > 0 else policy.max_chars
+
+
+def _speakable(chunk: str) -> str:
+    return _SPACE_RE.sub(" ", strip_markdown(chunk)).strip()
+
+
+async def speakable_chunks(
+    text: AsyncIterable[str], policy: Optional[ChunkPolicy] = None
+) -> AsyncIterable[str]:
+    """
+    Regroup streamed LLM tokens into speakable sentence or clause chunks as
+    they arrive, with markdown removed. The first chunk is kept short to
+    lower the time to first audio; the chunk sizes follow `policy`.
+    """
+    policy = policy or ChunkPolicy()
+    buffer = ""
+    first = True
+    async for token in text:
+        buffer += token
+        while True:
+            split = _next_split(buffer, policy, first)
+            if split is None:
+                break
+            chunk, buffer = _speakable(buffer[:split]), buffer[split:]
+            if chunk:
+                first = False
+                yield chunk + " "
+
+    chunk = _speakable(buffer)
+    if chunk:
+        yield chunk
@@ -2,25 +2,29 @@ import asyncio
 import os
 from dotenv import load_dotenv
 from openai import OpenAI
-from livekit.plugins import openai, rag
-import pickle
+from embedders import create_embedder, index_paths, serving_backend
+from docstore import DocStore
+from vector_index import load_vector_index
+from http_client import SharedHttpClient
 import numpy as np
-import aiohttp
 
 # Load environment variables
 load_dotenv()
 
-# Load the same data and index that main.py uses
-annoy_index = rag.annoy.AnnoyIndex.load('data/wise_faq_vdb')
-embeddings_dimension = 1536
+# Load the same data and index that main.py uses (selected by EMBEDDING_BACKEND)
+backend = serving_backend()
+index_path, documents_path = index_paths(backend)
+vector_index = load_vector_index(index_path)
 
-with open('./data/wise_faq_documents1.pkl', 'rb') as f:
-    faq_data = pickle.load(f)
+faq_data = DocStore.open(documents_path)
 
 async def test_rag_enrichment():
     print("\nRAG Testing Interface (Press Ctrl+C to exit)")
     print("--------------------------------------------")
     
+    # One pooled client for the whole run, as in the agent; the local backend doesn't use it
+    http_client = SharedHttpClient()
+    embedder = create_embedder(backend, http_session=http_client.session)
     try:
         while True:
             user_input = input("\nYou: ")
@@ -28,19 +32,11 @@ async def test_rag_enrichment():
                 continue
                 
             print("\nGenerating embedding...")
-            # Create an aiohttp session
-            async with aiohttp.ClientSession() as session:
-                # Pass the session to create_embeddings
-                user_embedding = await openai.create_embeddings(
-                    input=[user_input],
-                    model="text-embedding-3-small",
-                    dimensions=embeddings_dimension,
-                    http_session=session  # Pass the session here
-                )
+            user_embedding = await embedder.embed([user_input])
             
             print("Querying vector database...")
-            # Query the annoy index
-            result = annoy_index.query(user_embedding[0].embedding, n=1)[0]
+            # Query the vector index
+            result = vector_index.query(user_embedding[0], n=1)[0]
             print(f"\nMatch score: {result}")
             
             # Get the matched document
@@ -77,6 +73,9 @@ async def test_rag_enrichment():
             
     except KeyboardInterrupt:
         print("\nExiting...")
+    finally:
+        print(f"\nHTTP connections: {http_client.stats()}")
+        await http_client.aclose()
 
 if __name__ == "__main__":
     asyncio.run(test_rag_enrichment()) 
\ No newline at end of file
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the agent's modules are imported from the agent directory, like main.py does
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AGENT_DIR)
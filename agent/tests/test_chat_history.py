@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+
+from livekit.agents import llm
+
+from chat_history import CONTEXT_PREFIX, ChatHistory
+
+
+def _history(texts, **kwargs) -> ChatHistory:
+    messages = [llm.ChatMessage.create(text="You are a support agent.", role="system")]
+    messages += [llm.ChatMessage.create(text=text, role=role) for role, text in texts]
+    agent = SimpleNamespace(chat_ctx=llm.ChatContext(messages=messages), _llm=None)
+    return ChatHistory(agent, summarize=False, **kwargs)
+
+
+def test_short_history_is_not_compacted():
+    history = _history(
+        [
+            ("user", "Hi, I sent money yesterday."),
+            ("assistant", "Happy to help, what would you like to know?"),
+            ("user", "Where is my money?"),
+        ],
+        token_budget=0,
+        keep_messages=6,
+    )
+    question = history.messages[-1]
+    history.add_context("Transfers usually arrive within two days.", before=question)
+    before = list(history.messages)
+
+    assert history._oldest_turns() == []
+    history.maintain()
+    assert history._summary_task is None
+    assert history.messages == before
+    assert history.messages[3].content.startswith(CONTEXT_PREFIX)
+
+
+def test_oldest_turns_cut_on_a_user_message():
+    history = _history(
+        [
+            ("user", "u1"),
+            ("assistant", "a1"),
+            ("user", "u2"),
+            ("assistant", "a2"),
+            ("user", "u3"),
+            ("assistant", "a3"),
+            ("user", "u4"),
+        ],
+        keep_messages=3,
+    )
+    assert [m.content for m in history._oldest_turns()] == ["u1", "a1", "u2", "a2"]
+
+
+def test_compaction_keeps_the_recent_turns():
+    history = _history(
+        [("user", "u1"), ("assistant", "a1"), ("user", "u2"), ("assistant", "a2"), ("user", "u3")],
+        keep_messages=2,
+    )
+    asyncio.run(history._compact(history._oldest_turns()))
+    assert [m.content for m in history.messages[1:]] == ["u2", "a2", "u3"]
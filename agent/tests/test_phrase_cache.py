@@ -0,0 +1,58 @@
+import os
+import threading
+import time
+
+# plugins register on import, which must happen on the main thread (main.py
+# imports it at the top)
+from livekit.plugins import cartesia
+
+import phrase_cache
+from phrase_cache import PhraseCache, warm_phrase_cache
+
+
+class _FakeCachedTTS:
+    warmed: list = []
+
+    def __init__(self, tts, cache):
+        pass
+
+    async def warm(self, phrases):
+        _FakeCachedTTS.warmed.extend(phrases)
+
+
+def _wait_for_warmers():
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread() and thread.daemon:
+            thread.join(5)
+
+
+def test_warm_skips_while_another_process_holds_the_lock(tmp_path, monkeypatch):
+    monkeypatch.setattr(phrase_cache, "CachedTTS", _FakeCachedTTS)
+    monkeypatch.setattr(cartesia, "TTS", lambda **kwargs: None)
+    _FakeCachedTTS.warmed = []
+    cache = PhraseCache(str(tmp_path))
+    lock_path = tmp_path / ".warm.lock"
+    lock_path.touch()
+
+    warm_phrase_cache(cache, ["Hello!"])
+    _wait_for_warmers()
+
+    assert _FakeCachedTTS.warmed == []
+    assert lock_path.exists()
+
+
+def test_warm_takes_over_a_stale_lock_and_releases_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(phrase_cache, "CachedTTS", _FakeCachedTTS)
+    monkeypatch.setattr(cartesia, "TTS", lambda **kwargs: None)
+    _FakeCachedTTS.warmed = []
+    cache = PhraseCache(str(tmp_path))
+    lock_path = tmp_path / ".warm.lock"
+    lock_path.touch()
+    stale = time.time() - 3600
+    os.utime(lock_path, (stale, stale))
+
+    warm_phrase_cache(cache, ["Hello!"], timeout=5, lock_timeout=60)
+    _wait_for_warmers()
+
+    assert _FakeCachedTTS.warmed == ["Hello!"]
+    assert not lock_path.exists()
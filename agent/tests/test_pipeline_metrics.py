@@ -0,0 +1,61 @@
+import json
+import os
+import subprocess
+import sys
+import urllib.request
+
+import pipeline_metrics
+from pipeline_metrics import Counter, Histogram, MetricsCollector, Registry, start_metrics_server
+
+
+def _snapshot(requests: float, latencies) -> dict:
+    registry = Registry()
+    counter = registry.register(Counter("test_requests_total", "Requests.", ["result"]))
+    histogram = registry.register(Histogram("test_latency_seconds", "Latency.", buckets=(0.1, 1.0)))
+    counter.inc(requests, result="hit")
+    for latency in latencies:
+        histogram.observe(latency)
+    return registry.snapshot()
+
+
+def _exited_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def test_collector_adds_up_job_processes_and_archives_exited_ones(tmp_path):
+    exited = tmp_path / f"{_exited_pid()}.json"
+    exited.write_text(json.dumps(_snapshot(2, [0.05, 0.5])))
+    (tmp_path / f"{os.getpid()}.json").write_text(json.dumps(_snapshot(3, [2.0])))
+
+    text = MetricsCollector(str(tmp_path)).render()
+
+    assert 'test_requests_total{result="hit"} 5.0' in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_latency_seconds_sum 2.55" in text
+    # the exited process's counts moved to the archive and are kept
+    assert not exited.exists()
+    assert (tmp_path / "archive.json").exists()
+    assert MetricsCollector(str(tmp_path)).render() == text
+
+
+def test_server_serves_the_sum_without_session_labels(tmp_path, monkeypatch):
+    (tmp_path / f"{_exited_pid()}.json").write_text(json.dumps(_snapshot(7, [])))
+    port = start_metrics_server("127.0.0.1", 0, str(tmp_path))
+    # snapshots of an earlier worker are cleared
+    assert os.listdir(tmp_path) == []
+
+    monkeypatch.setattr(pipeline_metrics, "registry", Registry())
+    counter = pipeline_metrics.registry.register(Counter("test_escalations_total", "Escalations."))
+    pipeline_metrics.session_labels.set({"room": "room-1", "session": "job-1"})
+    counter.inc()
+    pipeline_metrics.MetricsExporter(str(tmp_path), interval=3600).write()
+
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+        text = response.read().decode("utf-8")
+    assert "test_escalations_total 1.0" in text
+    assert "test_requests_total" not in text
+    assert "room-1" not in text and "job-1" not in text
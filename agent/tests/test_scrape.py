@@ -0,0 +1,70 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import aiohttp
+import pytest
+
+from data.scrape import Crawler, HostLimiter, HttpCache
+
+ARTICLE = b"<html><body><h1>Where is my money?</h1><article><p>Soon.</p></article></body></html>"
+ETAG = '"v1"'
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # request headers of every GET, per path
+    requests: dict = {}
+
+    def do_GET(self):
+        self.requests.setdefault(self.path, []).append(dict(self.headers))
+        validators = {"/etag": ("ETag", ETAG), "/last-modified": ("Last-Modified", LAST_MODIFIED)}
+        name, value = validators[self.path]
+        condition = "If-None-Match" if name == "ETag" else "If-Modified-Since"
+        if self.headers.get(condition) == value:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header(name, value)
+        self.send_header("Content-Length", str(len(ARTICLE)))
+        self.end_headers()
+        self.wfile.write(ARTICLE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Handler.requests = {}
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+async def _fetch_twice(cache: HttpCache, url: str) -> list[tuple[bytes, dict]]:
+    results = []
+    async with aiohttp.ClientSession() as session:
+        for _ in range(2):
+            crawler = Crawler(session, cache, HostLimiter(rate=0), max_retries=0)
+            results.append((await crawler.fetch(url), crawler.stats))
+    return results
+
+
+@pytest.mark.parametrize(
+    "path, condition, value",
+    [("/etag", "If-None-Match", ETAG), ("/last-modified", "If-Modified-Since", LAST_MODIFIED)],
+)
+def test_refetch_revalidates_the_cached_response(server, tmp_path, path, condition, value):
+    cache = HttpCache(str(tmp_path))
+    (first, first_stats), (second, second_stats) = asyncio.run(_fetch_twice(cache, server + path))
+
+    assert first == second == ARTICLE
+    assert first_stats["fetched"] == 1 and first_stats["not_modified"] == 0
+    assert second_stats["fetched"] == 0 and second_stats["not_modified"] == 1
+
+    initial, conditional = _Handler.requests[path]
+    assert condition not in initial
+    assert conditional[condition] == value
@@ -0,0 +1,55 @@
+import json
+import os
+import time
+
+import voices
+from voices import VoiceCatalogue
+
+
+def _write(path, data, mtime=None):
+    path.write_text(json.dumps(data))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_current_picks_up_a_cache_written_by_another_process(tmp_path, monkeypatch):
+    fetches = []
+
+    def fetch(timeout):
+        fetches.append(timeout)
+        raise RuntimeError("no network in tests")
+
+    monkeypatch.setattr(voices, "fetch_cartesia_voices", fetch)
+    cache, snapshot = tmp_path / "cache.json", tmp_path / "snapshot.json"
+    _write(snapshot, [{"id": "default", "name": "Default"}])
+
+    catalogue = VoiceCatalogue(str(cache), str(snapshot), ttl=60).load()
+    catalogue._refresh_thread.join(5)
+    assert len(catalogue.current()) == 1
+    # a failed refresh is not retried on every access
+    assert len(fetches) == 1
+
+    # another process refreshed the shared cache
+    _write(cache, [{"id": "a", "name": "A"}, {"id": "b", "name": "B", "embedding": [0.1]}])
+    registry = catalogue.current()
+    assert len(registry) == 2
+    assert registry.get("b").embedding == [0.1]
+    assert len(fetches) == 1
+
+
+def test_current_refreshes_a_stale_cache_in_a_live_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(voices, "fetch_cartesia_voices", lambda timeout: [{"id": "new", "name": "New"}])
+    cache = tmp_path / "cache.json"
+    _write(cache, [{"id": "old", "name": "Old"}])
+
+    catalogue = VoiceCatalogue(str(cache), str(tmp_path / "snapshot.json"), ttl=60).load()
+    assert catalogue._refresh_thread is None
+    assert catalogue.current().get("old") is not None
+
+    # the process outlives the TTL
+    stale = time.time() - 120
+    os.utime(cache, (stale, stale))
+    catalogue.current()
+    catalogue._refresh_thread.join(5)
+    assert catalogue.current().get("new") is not None
+    assert json.loads(cache.read_text()) == [{"id": "new", "name": "New"}]
@@ -0,0 +1,84 @@
+import time
+from contextlib import contextmanager
+from typing import AsyncIterable, Optional
+
+from livekit.agents import llm
+from livekit.agents.log import logger
+
+
+class TurnTimings:
+    """
+    Per-stage timings of a single RAG turn, measured from the moment
+    retrieval starts. Stages are recorded in seconds and logged once
+    the turn has produced its first audio, together with event counters
+    (e.g. HTTP connections opened or reused).
+    """
+
+    def __init__(self, budget: Optional[float] = None):
+        self.budget = budget
+        self.started_at = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        self.counters: dict[str, int] = {}
+        self.timed_out = False
+        # id of the speech that answers this turn, used to match TTS metrics
+        self.speech_id: Optional[str] = None
+        self._logged = False
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def remaining(self) -> Optional[float]:
+        if self.budget is None:
+            return None
+        return max(self.budget - self.elapsed(), 0.0)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = time.perf_counter() - start
+
+    def record(self, name: str, seconds: float) -> None:
+        self.stages[name] = seconds
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def log(self) -> None:
+        if self._logged:
+            return
+        self._logged = True
+        stages = " ".join(f"{k}={v * 1000:.0f}ms" for k, v in self.stages.items())
+        counters = "".join(f" {k}={v}" for k, v in self.counters.items())
+        logger.info(
+            f"RAG turn timings: {stages} total={self.elapsed() * 1000:.0f}ms{counters}"
+            + (" (retrieval budget exceeded)" if self.timed_out else ""),
+            extra={
+                "stages": dict(self.stages),
+                "counters": dict(self.counters),
+                "timed_out": self.timed_out,
+            },
+        )
+
+
+async def timed_llm_text(
+    llm_stream: llm.LLMStream, turn: TurnTimings
+) -> AsyncIterable[str]:
+    """
+    Yield the text of an LLM stream, recording the time to the first token.
+    """
+    start = time.perf_counter()
+    first = True
+    async with llm_stream:
+        async for chunk in llm_stream:
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if not content:
+                continue
+            if first:
+                turn.record("llm_first_token", time.perf_counter() - start)
+                first = False
+            yield content
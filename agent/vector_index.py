@@ -0,0 +1,217 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+
+from livekit.agents.log import logger
+
+# Files written next to the Annoy index by data/build_data.py
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.json"
+HNSW_FILE = "hnsw.bin"
+
+# Corpora up to this size are searched exactly; a brute-force matmul over a
+# few thousand vectors is both faster and more accurate than an ANN index.
+EXACT_MAX_ITEMS = int(os.getenv("VECTOR_INDEX_EXACT_MAX_ITEMS", "20000"))
+
+
+@dataclass
+class QueryResult:
+    userdata: Any
+    distance: float
+
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+def _angular(cosine: np.ndarray) -> np.ndarray:
+    # same distance Annoy reports for the "angular" metric: sqrt(2 - 2cos)
+    return np.sqrt(np.maximum(2.0 - 2.0 * cosine, 0.0))
+
+
+class VectorIndex:
+    """
+    Nearest-neighbour search over document embeddings. All backends return
+    the `n` closest items as `QueryResult`s sorted by angular distance.
+    """
+
+    name: str
+
+    def query(self, vector: Sequence[float], n: int) -> List[QueryResult]:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class ExactIndex(VectorIndex):
+    """
+    Brute-force search: one matmul against a normalized float32 matrix.
+    """
+
+    name = "exact"
+
+    def __init__(self, vectors: np.ndarray, ids: List[Any], normalized: bool = False):
+        # rows that are already unit length (e.g. a memory-mapped vectors.npy)
+        # are used as-is rather than copied
+        self._matrix = vectors if normalized else _unit_rows(np.asarray(vectors))
+        self._ids = ids
+
+    def query(self, vector: Sequence[float], n: int) -> List[QueryResult]:
+        q = np.asarray(vector, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+        cosine = self._matrix @ q
+        n = min(n, len(self._ids))
+        top = np.argpartition(-cosine, n - 1)[:n]
+        top = top[np.argsort(-cosine[top])]
+        distances = _angular(cosine[top])
+        return [QueryResult(self._ids[i], float(d)) for i, d in zip(top, distances)]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class AnnoyBackend(VectorIndex):
+    """
+    The livekit rag plugin's Annoy index.
+    """
+
+    name = "annoy"
+
+    def __init__(self, index):
+        self._index = index
+
+    @classmethod
+    def load(cls, path: str) -> "AnnoyBackend":
+        from livekit.plugins import rag
+
+        return cls(rag.annoy.AnnoyIndex.load(path))
+
+    def query(self, vector: Sequence[float], n: int) -> List[QueryResult]:
+        return [
+            QueryResult(r.userdata, r.distance) for r in self._index.query(list(vector), n=n)
+        ]
+
+    def __len__(self) -> int:
+        return self._index.size
+
+
+class HNSWIndex(VectorIndex):
+    """
+    Hierarchical navigable small world graph (hnswlib), for corpora too large
+    to search exactly.
+    """
+
+    name = "hnsw"
+
+    def __init__(self, index, ids: List[Any], ef: int = 64):
+        self._index = index
+        self._index.set_ef(ef)
+        self._ids = ids
+
+    @classmethod
+    def build(
+        cls, vectors: np.ndarray, ids: List[Any], m: int = 16, ef_construction: int = 200
+    ) -> "HNSWIndex":
+        import hnswlib
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        index = hnswlib.Index(space="cosine", dim=vectors.shape[1])
+        index.init_index(max_elements=len(ids), M=m, ef_construction=ef_construction)
+        index.add_items(vectors, np.arange(len(ids)))
+        return cls(index, ids)
+
+    @classmethod
+    def load(cls, path: str, dim: int, ids: List[Any]) -> "HNSWIndex":
+        import hnswlib
+
+        index = hnswlib.Index(space="cosine", dim=dim)
+        index.load_index(path, max_elements=len(ids))
+        return cls(index, ids)
+
+    def save(self, path: str) -> None:
+        self._index.save_index(path)
+
+    def query(self, vector: Sequence[float], n: int) -> List[QueryResult]:
+        n = min(n, len(self._ids))
+        labels, distances = self._index.knn_query(np.asarray(vector, dtype=np.float32), k=n)
+        # hnswlib's cosine distance is 1 - cos; report angular distance like the others
+        angular = np.sqrt(np.maximum(2.0 * distances[0], 0.0))
+        return [QueryResult(self._ids[i], float(d)) for i, d in zip(labels[0], angular)]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+def load_vectors(path: str) -> tuple[np.ndarray, List[Any]]:
+    """
+    Load the unit-length vectors of an index directory. Indexes built before
+    the vectors were saved alongside are read back out of the Annoy file.
+    """
+    vectors_path = os.path.join(path, VECTORS_FILE)
+    if os.path.exists(vectors_path):
+        with open(os.path.join(path, IDS_FILE), "r") as f:
+            ids = json.load(f)
+        vectors = np.load(vectors_path, mmap_mode="r")
+    else:
+        # items() is a generator, read it once
+        items = list(AnnoyBackend.load(path)._index.items())
+        vectors = _unit_rows(np.array([item.vector for item in items], dtype=np.float32))
+        ids = [item.userdata for item in items]
+
+    if len(ids) != vectors.shape[0]:
+        raise ValueError(f"{path} has {vectors.shape[0]} vectors but {len(ids)} ids")
+    return vectors, ids
+
+
+def save_vectors(path: str, vectors: np.ndarray, ids: List[Any]) -> None:
+    np.save(os.path.join(path, VECTORS_FILE), _unit_rows(np.asarray(vectors, dtype=np.float32)))
+    with open(os.path.join(path, IDS_FILE), "w") as f:
+        json.dump(ids, f)
+
+
+def _hnsw_available() -> bool:
+    try:
+        import hnswlib  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def load_vector_index(path: str, backend: Optional[str] = None) -> VectorIndex:
+    """
+    Load the index directory with the backend selected by
+    `VECTOR_INDEX_BACKEND` (auto, exact, annoy or hnsw). `auto` searches small
+    corpora exactly and uses HNSW (or Annoy without hnswlib) above
+    `VECTOR_INDEX_EXACT_MAX_ITEMS`.
+    """
+    backend = backend or os.getenv("VECTOR_INDEX_BACKEND", "auto")
+    if backend == "annoy":
+        return AnnoyBackend.load(path)
+
+    vectors, ids = load_vectors(path)
+    if backend == "auto":
+        if len(ids) <= EXACT_MAX_ITEMS:
+            backend = "exact"
+        elif _hnsw_available():
+            backend = "hnsw"
+        else:
+            return AnnoyBackend.load(path)
+
+    if backend == "exact":
+        index = ExactIndex(vectors, ids, normalized=True)
+    elif backend == "hnsw":
+        hnsw_path = os.path.join(path, HNSW_FILE)
+        if os.path.exists(hnsw_path):
+            index = HNSWIndex.load(hnsw_path, vectors.shape[1], ids)
+        else:
+            index = HNSWIndex.build(vectors, ids)
+    else:
+        raise ValueError(f"Unknown vector index backend: {backend}")
+    logger.info(f"loaded {index.name} vector index with {len(ids)} items from {path}")
+    return index
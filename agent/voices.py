@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+import requests
+
+from livekit.agents.log import logger
+
+CARTESIA_VOICES_URL = "https://api.cartesia.ai/voices"
+
+
+def fetch_cartesia_voices(timeout: float = 5.0) -> List[dict[str, Any]]:
+    headers = {
+        "X-API-Key": os.getenv("CARTESIA_API_KEY", ""),
+        "Cartesia-Version": "2024-08-01",
+        "Content-Type": "application/json",
+    }
+    response = requests.get(CARTESIA_VOICES_URL, headers=headers, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+def _write_json_atomic(path: str, data: Any) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+@dataclass(frozen=True)
+class Voice:
+    id: str
+    name: str
+    language: str
+    # None when the list has no embedding; the voice is then selected by id
+    embedding: Optional[List[float]] = None
+
+
+class VoiceRegistry:
+    """
+    Voices indexed by id, with the sorted "voices" participant attribute
+    serialized once so every room can publish it as is.
+    """
+
+    def __init__(self, voices: List[dict[str, Any]]):
+        self._by_id: dict[str, Voice] = {}
+        for data in voices:
+            if "id" not in data:
+                continue
+            self._by_id[data["id"]] = Voice(
+                id=data["id"],
+                name=data.get("name", data["id"]),
+                language=data.get("language") or "en",
+                embedding=data.get("embedding"),
+            )
+        self.attribute_payload = json.dumps(
+            sorted(
+                ({"id": v.id, "name": v.name} for v in self._by_id.values()),
+                key=lambda x: x["name"],
+            )
+        )
+
+    def get(self, voice_id: str) -> Optional[Voice]:
+        return self._by_id.get(voice_id)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+
+class VoiceCatalogue:
+    """
+    The Cartesia voice list, served from an on-disk cache shared by all
+    worker processes and falling back to a bundled snapshot, so startup never
+    waits on the Cartesia API. When the cache is older than `ttl` one process
+    refreshes it on a background thread; `voices` and `registry` are
+    replaced when it completes.
+
+    `current()` re-reads the cache when another process has written a newer
+    one, and starts a refresh once it is stale, so long-lived processes keep
+    up with the list. A failed refresh is retried after `retry_interval`.
+    """
+
+    def __init__(
+        self,
+        cache_path: str,
+        fallback_path: str,
+        ttl: float = 86400.0,
+        timeout: float = 5.0,
+        retry_interval: float = 300.0,
+    ):
+        self.cache_path = cache_path
+        self.fallback_path = fallback_path
+        self.ttl = ttl
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.voices: List[dict[str, Any]] = []
+        self.registry = VoiceRegistry([])
+        self._refresh_thread: Optional[threading.Thread] = None
+        # mtime of the cache file the voices were read from, None for the snapshot
+        self._cache_mtime: Optional[float] = None
+        self._last_refresh = 0.0
+
+    def load(self) -> "VoiceCatalogue":
+        if not self._load_cache():
+            try:
+                with open(self.fallback_path, "r") as f:
+                    self._set_voices(json.load(f))
+            except (FileNotFoundError, json.JSONDecodeError):
+                logger.warning("no cached or bundled Cartesia voice list found")
+
+        if self._is_stale():
+            self.refresh_in_background()
+        return self
+
+    def current(self) -> VoiceRegistry:
+        """
+        The latest voice registry: picks up a cache file written since it was
+        last read and starts a refresh when it is stale.
+        """
+        try:
+            mtime = os.path.getmtime(self.cache_path)
+        except FileNotFoundError:
+            mtime = None
+        if mtime is not None and (self._cache_mtime is None or mtime > self._cache_mtime):
+            self._load_cache()
+        if self._is_stale():
+            self.refresh_in_background()
+        return self.registry
+
+    def _load_cache(self) -> bool:
+        try:
+            mtime = os.path.getmtime(self.cache_path)
+            with open(self.cache_path, "r") as f:
+                voices = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+        self._set_voices(voices)
+        self._cache_mtime = mtime
+        return True
+
+    def _set_voices(self, voices: List[dict[str, Any]]) -> None:
+        self.voices = voices
+        self.registry = VoiceRegistry(voices)
+
+    def _is_stale(self) -> bool:
+        try:
+            return time.time() - os.path.getmtime(self.cache_path) > self.ttl
+        except FileNotFoundError:
+            return True
+
+    def refresh_in_background(self) -> None:
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return
+        if time.time() - self._last_refresh < self.retry_interval:
+            return
+        self._last_refresh = time.time()
+        self._refresh_thread = threading.Thread(target=self._refresh, daemon=True)
+        self._refresh_thread.start()
+
+    def _refresh(self) -> None:
+        # only one process refreshes; the others pick the file up on next load
+        lock_path = self.cache_path + ".lock"
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) < 4 * self.timeout:
+                    return
+                # left behind by a process that died mid-refresh
+                os.remove(lock_path)
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except (FileNotFoundError, FileExistsError):
+                return
+        os.close(fd)
+        try:
+            voices = fetch_cartesia_voices(timeout=self.timeout)
+            _write_json_atomic(self.cache_path, voices)
+            self._set_voices(voices)
+            self._cache_mtime = os.path.getmtime(self.cache_path)
+            logger.info(f"refreshed Cartesia voice list ({len(voices)} voices)")
+        except Exception as e:
+            logger.warning(f"Failed to fetch Cartesia voices: {e}")
+        finally:
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+
+
+if __name__ == "__main__":
+    # Refresh the bundled fallback snapshot:
+    #   python voices.py data/cartesia_voices.json
+    import sys
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    _write_json_atomic(sys.argv[1], fetch_cartesia_voices())